@@ -1,19 +1,28 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
+import logging
+import re
 import sys
-from datetime import datetime
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-import yaml
+try:  # pragma: no cover - optional dependency
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
 
-from .config import ConfigError, load_settings
-from .dom_indexer import DOMSemanticIndexer
-from .nl_agent import NaturalLanguageOrchestrator, TranscriptEntry
-from .playwright_ctx import PlaywrightManager
-from .runner import ScenarioRunner
+if TYPE_CHECKING:
+    from .nl_agent import NaturalLanguageOrchestrator, TranscriptEntry
+
+# URL extraction patterns used by _extract_target_url
+_RE_FULL_URL = re.compile(r'https?://[^\s\)\"\']+')
+_RE_TRAIL_PUNCT = re.compile(r'[,\.!?]+$')
+_RE_ABS_PATH = re.compile(r'/[\w\-/\.]+\.html')
+_RE_FILENAME = re.compile(r'\b[\w\-]+\.html\b')
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -26,6 +35,8 @@ def build_parser() -> argparse.ArgumentParser:
     run.add_argument("--nl", help="Inline natural language instructions")
     run.add_argument("--nl-file", help="Path to a text file with natural language instructions")
     run.add_argument("--dynamic", action="store_true", help="Use dynamic NL agent (step-by-step decision making)")
+    run.add_argument("--no-dom-cache", action="store_true", help="Always re-capture the DOM instead of using the on-disk cache")
+    run.add_argument("--no-plan-cache", action="store_true", help="Always ask the LLM for a new plan instead of using the on-disk plan cache")
     return parser
 
 
@@ -36,6 +47,14 @@ def main(argv: list[str] | None = None) -> int:
         parser.print_help()
         return 0
 
+    # Read natural language prompt before loading any settings
+    nl_prompt = _read_nl_prompt(args.nl, args.nl_file)
+    
+    if not nl_prompt:
+        parser.error("Natural language prompt required (use --nl or --nl-file)")
+    
+    from .config import ConfigError, load_settings
+
     try:
         settings = load_settings(args.config)
     except ConfigError as exc:
@@ -44,12 +63,6 @@ def main(argv: list[str] | None = None) -> int:
 
     base_env: Dict[str, Any] = {"baseUrl": settings.base_url}
     
-    # Read natural language prompt
-    nl_prompt = _read_nl_prompt(args.nl, args.nl_file)
-    
-    if not nl_prompt:
-        parser.error("Natural language prompt required (use --nl or --nl-file)")
-    
     dom_context = None
     nl_builder: Optional[NaturalLanguageOrchestrator] = None
     nl_attempt = 0
@@ -63,7 +76,10 @@ def main(argv: list[str] | None = None) -> int:
         headful_override = True if args.headful else None
         slow_mo_override = args.slowmo
         
-        from .dynamic_nl_agent import DynamicNLAgent
+        from .dynamic_nl_agent import DynamicNLAgent, log as agent_log
+        from .playwright_ctx import PlaywrightManager
+        
+        _attach_agent_log(agent_log)
         
         try:
             with PlaywrightManager(settings, headful=headful_override, slow_mo=slow_mo_override) as session:
@@ -90,39 +106,55 @@ def main(argv: list[str] | None = None) -> int:
 
     # Static NL mode - generate full scenario upfront, then execute
     print(f"[ui-test-agent] Static NL mode: generating scenario from instructions...")
-    builder = NaturalLanguageOrchestrator(settings)
-    
-    # Extract target URL from user instructions (if specified)
-    target_url = _extract_target_url(nl_prompt, settings.base_url)
-    dom_context = _collect_dom_context(target_url, nl_builder=builder)
+    from .nl_agent import NaturalLanguageOrchestrator
+    from .playwright_ctx import PlaywrightManager
+    from .runner import ScenarioRunner
     
-    try:
-        generated = builder.build(nl_prompt, base_env, dom_context=dom_context)
-    except Exception as exc:
-        print(f"Scenario generation failed: {exc}")
-        return 2
-    
-    # Persist the generated plan to artifacts
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    scenario_label = _persist_generated_plan(
-        plan=generated.raw_plan,
-        transcript=generated.transcript,
-        artifacts_dir=settings.artifacts_dir,
-        explicit_path=None,
-        suffix="v1",
-    )
-    
-    print(f"[ui-test-agent] Scenario generated and saved to: {scenario_label}")
-    print(f"[ui-test-agent] Executing {len(generated.scenario.flow)} steps...")
-    
-    # Execute the generated scenario
     headful_override = True if args.headful else None
     slow_mo_override = args.slowmo
     
-    with PlaywrightManager(settings, headful=headful_override, slow_mo=slow_mo_override) as session:
-        runner = ScenarioRunner(settings, generated.scenario, session.page)
-        result = runner.run(scenario_label)
+    with NaturalLanguageOrchestrator(settings, use_plan_cache=not args.no_plan_cache) as builder:
+        # Extract target URL from user instructions (if specified)
+        target_url = _extract_target_url(nl_prompt, settings.base_url)
+        dom_context = _collect_dom_context(
+            target_url,
+            nl_builder=builder,
+            cache_dir=None if args.no_dom_cache else Path(settings.artifacts_dir) / "dom_cache",
+            cache_ttl=settings.dom_cache_ttl,
+        )
+        
+        try:
+            generated = builder.build(nl_prompt, base_env, dom_context=dom_context)
+        except Exception as exc:
+            print(f"Scenario generation failed: {exc}")
+            return 2
+        
+        # Persist the generated plan to artifacts
+        timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+        scenario_label = _persist_generated_plan(
+            plan=generated.raw_plan,
+            transcript=generated.transcript,
+            artifacts_dir=settings.artifacts_dir,
+            explicit_path=None,
+            suffix="v1",
+            timestamp=timestamp,
+        )
+        
+        print(f"[ui-test-agent] Scenario generated and saved to: {scenario_label}")
+        print(f"[ui-test-agent] Executing {len(generated.scenario.flow)} steps...")
+        
+        # The recording session (video, HAR, console log) opens only once the plan exists
+        with PlaywrightManager(settings, headful=headful_override, slow_mo=slow_mo_override) as session:
+            runner = ScenarioRunner(settings, generated.scenario, session.page)
+            try:
+                result = runner.run(scenario_label)
+            except Exception:
+                builder.discard_cached_plan(generated)
+                raise
         success = result.success
+        if not success:
+            # Don't replay a plan that just failed on the next run
+            builder.discard_cached_plan(generated)
         report = result.report
     
     scenario_name = report.meta.get("name", scenario_label)
@@ -131,6 +163,17 @@ def main(argv: list[str] | None = None) -> int:
     return 0 if success else 1
 
 
+def _attach_agent_log(logger: logging.Logger) -> None:
+    """Print dynamic agent progress to stdout with the familiar prefix."""
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("[dynamic-agent] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
 if __name__ == "__main__":  # pragma: no cover
     sys.exit(main())
 
@@ -163,20 +206,18 @@ def _extract_target_url(nl_prompt: str, base_url: str) -> str:
     Returns:
         Full URL to extract DOM from
     """
-    import re
-    
     # Pattern 1: Full URL (http://... or https://...)
     # Matches: http://localhost:8000/page.html, https://example.com/login
-    full_url_match = re.search(r'https?://[^\s\)\"\']+', nl_prompt)
+    full_url_match = _RE_FULL_URL.search(nl_prompt)
     if full_url_match:
         url = full_url_match.group(0)
         # Clean trailing punctuation
-        url = re.sub(r'[,\.!?]+$', '', url)
+        url = _RE_TRAIL_PUNCT.sub('', url)
         print(f"[ui-test-agent] Found full URL in instructions: {url}")
         return url
     
     # Pattern 2: Absolute path starting with / (/demo_login.html, /app/login)
-    path_match = re.search(r'/[\w\-/\.]+\.html', nl_prompt)
+    path_match = _RE_ABS_PATH.search(nl_prompt)
     if path_match:
         path = path_match.group(0)
         url = base_url.rstrip('/') + path
@@ -184,7 +225,7 @@ def _extract_target_url(nl_prompt: str, base_url: str) -> str:
         return url
     
     # Pattern 3: Relative filename (demo_login.html, index.html, login.html)
-    filename_match = re.search(r'\b[\w\-]+\.html\b', nl_prompt)
+    filename_match = _RE_FILENAME.search(nl_prompt)
     if filename_match:
         filename = filename_match.group(0)
         url = base_url.rstrip('/') + '/' + filename
@@ -202,63 +243,140 @@ def _persist_generated_plan(
     artifacts_dir: str,
     explicit_path: Optional[str],
     suffix: Optional[str] = None,
+    timestamp: Optional[str] = None,
 ) -> str:
     artifacts = Path(artifacts_dir)
     artifacts.mkdir(parents=True, exist_ok=True)
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    if timestamp is None:
+        timestamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
     suffix_str = f"_{suffix}" if suffix else ""
     json_path = artifacts / f"nl_plan_{timestamp}{suffix_str}.json"
-    json_path.write_text(json.dumps(plan, indent=2, ensure_ascii=False), encoding="utf-8")
-
     yaml_path = Path(explicit_path) if explicit_path else artifacts / f"nl_scenario_{timestamp}{suffix_str}.yml"
-    with yaml_path.open("w", encoding="utf-8") as handle:
-        yaml.safe_dump(plan, handle, sort_keys=False, allow_unicode=True)
-
     transcript_path = artifacts / f"nl_transcript_{timestamp}{suffix_str}.md"
-    with transcript_path.open("w", encoding="utf-8") as handle:
-        for entry in transcript:
-            handle.write(f"## [{entry.author}]\n{entry.text.strip()}\n\n")
+
+    import yaml
+
+    try:  # pragma: no cover - libyaml bindings are optional
+        from yaml import CSafeDumper as SafeDumper
+    except ImportError:  # pragma: no cover
+        from yaml import SafeDumper
+
+    # Serialize everything in memory first, then write the three files
+    if orjson is not None:
+        json_body = orjson.dumps(plan, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        json_body = json.dumps(plan, indent=2, ensure_ascii=False).encode("utf-8")
+    yaml_body = yaml.dump(plan, Dumper=SafeDumper, sort_keys=False, allow_unicode=True).encode("utf-8")
+    transcript_body = "".join(
+        f"## [{entry.author}]\n{entry.text.strip()}\n\n" for entry in transcript
+    ).encode("utf-8")
+
+    json_path.write_bytes(json_body)
+    yaml_path.write_bytes(yaml_body)
+    transcript_path.write_bytes(transcript_body)
 
     return str(yaml_path)
 
 
-def _collect_dom_context(base_url: str, nl_builder=None) -> Optional[str]:
+def _collect_dom_context(
+    base_url: str,
+    nl_builder: Optional["NaturalLanguageOrchestrator"] = None,
+    cache_dir: Optional[Path] = None,
+    cache_ttl: int = 0,
+) -> Optional[str]:
     """
     Collect DOM context using DOMSemanticIndexer for better accuracy.
-    Supports caching to avoid redundant captures.
+    Supports caching to avoid redundant captures: in-memory on the builder,
+    and on disk under cache_dir keyed by URL. A disk entry younger than
+    cache_ttl seconds is used without navigating; older entries are
+    revalidated against the page HTML hash.
+    Captures in a throwaway headless browser, so the recorded test session
+    never sees the capture traffic, cookies or storage.
     """
     try:
         # Try to use cached DOM if available
-        if nl_builder and hasattr(nl_builder, 'get_cached_dom'):
+        if nl_builder is not None:
             cached = nl_builder.get_cached_dom(base_url)
             if cached:
                 print("[ui-test-agent] Using cached DOM context")
                 return cached
         
+        if cache_dir is not None and cache_ttl > 0:
+            cached = _read_fresh_dom_cache(_dom_cache_path(cache_dir, base_url), cache_ttl)
+            if cached:
+                print("[ui-test-agent] Using DOM context from disk cache")
+                if nl_builder is not None:
+                    nl_builder.cache_dom(base_url, cached)
+                return cached
+        
         print(f"[ui-test-agent] Extracting DOM from: {base_url}")
-        # Use playwright directly for DOM extraction
         from playwright.sync_api import sync_playwright
         
         with sync_playwright() as p:
             browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.goto(base_url, wait_until="networkidle", timeout=10000)
-            
-            indexer = DOMSemanticIndexer(page)
-            elements = indexer.build_index(max_elements=150)
-            context = indexer.to_context_string()
-            
-            browser.close()
-            
-            print(f"[ui-test-agent] Found {len(elements)} interactive elements")
-            
-            # Cache it if builder supports caching
-            if nl_builder and hasattr(nl_builder, 'cache_dom'):
-                nl_builder.cache_dom(base_url, context)
-            
-            return context
+            try:
+                context, element_count = _index_page(browser.new_page(), base_url, cache_dir)
+            finally:
+                browser.close()
+        
+        print(f"[ui-test-agent] Found {element_count} interactive elements")
+        
+        # Cache it on the builder for subsequent builds in this process
+        if nl_builder is not None:
+            nl_builder.cache_dom(base_url, context)
+        
+        return context
     except Exception as exc:
         print(f"[ui-test-agent] DOM extraction failed: {exc}")
         return None
 
 
+def _index_page(page, url: str, cache_dir: Optional[Path] = None) -> Tuple[str, int]:
+    """
+    Navigate page to url and return (context string, element count).
+    When cache_dir is set, an unchanged page (same HTML hash) reuses the stored index.
+    """
+    page.goto(url, wait_until="networkidle", timeout=10000)
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = _dom_cache_path(cache_dir, url)
+        content_hash = hashlib.blake2b(page.content().encode("utf-8"), digest_size=16).hexdigest()
+        try:
+            cached = json.loads(cache_path.read_text(encoding="utf-8"))
+            if cached.get("hash") == content_hash:
+                print("[ui-test-agent] Page unchanged, using DOM index from disk cache")
+                return cached["context"], int(cached.get("elements", 0))
+        except (OSError, ValueError, KeyError):
+            pass
+
+    from .dom_indexer import DOMSemanticIndexer
+
+    indexer = DOMSemanticIndexer(page)
+    elements = indexer.build_index(max_elements=150)
+    context = indexer.to_context_string()
+
+    if cache_path is not None:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(
+                json.dumps({"hash": content_hash, "context": context, "elements": len(elements)}, ensure_ascii=False),
+                encoding="utf-8",
+            )
+        except OSError:
+            pass
+    return context, len(elements)
+
+
+def _dom_cache_path(cache_dir: Path, url: str) -> Path:
+    return cache_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+
+def _read_fresh_dom_cache(cache_path: Path, ttl: int) -> Optional[str]:
+    """Return the cached context string if the cache file is younger than ttl seconds."""
+    try:
+        if time.time() - cache_path.stat().st_mtime >= ttl:
+            return None
+        return json.loads(cache_path.read_text(encoding="utf-8"))["context"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
@@ -9,21 +9,26 @@ from urllib.parse import urlparse
 import yaml
 from dotenv import load_dotenv
 
+try:  # pragma: no cover - libyaml bindings are optional
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class TimeoutConfig:
     default: int = 8000
     url: int = 15000
     api: int = 20000
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class RetryConfig:
     step: int = 1
     scenario: int = 0
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Settings:
     mode: str
     base_url: str
@@ -36,27 +41,40 @@ class Settings:
     allowed_hosts: List[str]
     artifacts_dir: str
     gemini_api_key: str | None
+    dom_cache_ttl: int = 300
 
 
 class ConfigError(RuntimeError):
     """Raised when configuration cannot be loaded."""
 
 
+# .env is read into os.environ once per process
+_DOTENV_LOADED = False
+
+
 def load_settings(config_path: str | os.PathLike[str]) -> Settings:
-    load_dotenv(override=False)
+    global _DOTENV_LOADED
+    if not _DOTENV_LOADED:
+        load_dotenv(override=False)
+        _DOTENV_LOADED = True
     path = Path(config_path)
     if not path.exists():
         raise ConfigError(f"Config file not found: {path}")
 
-    with path.open("r", encoding="utf-8") as handle:
-        raw = yaml.safe_load(handle) or {}
+    raw = yaml.load(path.read_bytes(), Loader=SafeLoader) or {}
 
     try:
         timeouts_raw = raw.get("timeouts", {})
         retry_raw = raw.get("retry", {})
+        base_url = raw["baseUrl"]
+        allowed_hosts = list(raw.get("allowedHosts", []))
+        if not allowed_hosts:
+            hostname = urlparse(base_url).hostname
+            if hostname:
+                allowed_hosts = [hostname]
         settings = Settings(
             mode=raw.get("mode", "function_tools"),
-            base_url=raw["baseUrl"],
+            base_url=base_url,
             headless=bool(raw.get("headless", True)),
             slow_mo=int(raw.get("slowMo", 0)),
             timeouts=TimeoutConfig(
@@ -70,16 +88,12 @@ def load_settings(config_path: str | os.PathLike[str]) -> Settings:
             ),
             record_video=bool(raw.get("recordVideo", False)),
             collect_har=bool(raw.get("collectHAR", False)),
-            allowed_hosts=list(raw.get("allowedHosts", [])),
+            allowed_hosts=allowed_hosts,
             artifacts_dir=str(raw.get("artifactsDir", "artifacts")),
             gemini_api_key=os.getenv("GEMINI_API_KEY"),
+            dom_cache_ttl=int(raw.get("domCacheTtl", 300)),
         )
     except KeyError as exc:
         raise ConfigError(f"Missing required config key: {exc}") from exc
 
-    if not settings.allowed_hosts:
-        parsed = urlparse(settings.base_url)
-        if parsed.hostname:
-            settings.allowed_hosts = [parsed.hostname]
-
     return settings
@@ -12,12 +12,231 @@ Much smarter than raw HTML snippets.
 
 from __future__ import annotations
 
+import io
 import json
-from typing import Dict, List, Any, Optional
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Any, Optional, Tuple
 
 from .dom_indexer import ElementInfo
 
 
+# Keyword tables for intent detection (case-insensitive substring match).
+# "intent:*" tags drive the Detected Intent section, "example:*" tags pick
+# the few-shot example.
+_KEYWORD_TAGS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("intent:auth", ("login", "sign in", "log in", "authenticate")),
+    ("intent:search", ("search", "find", "look for")),
+    ("intent:ecommerce", ("cart", "checkout", "purchase", "buy", "add to cart")),
+    ("intent:form", ("fill", "enter", "type", "input")),
+    ("intent:navigation", ("go to", "navigate", "open", "visit")),
+    ("intent:click", ("click", "press", "tap")),
+    ("intent:verify", ("verify", "check", "ensure", "confirm")),
+    ("example:login", ("login", "sign in", "authenticate")),
+    ("example:search", ("search", "find")),
+    ("example:ecommerce", ("cart", "checkout", "purchase")),
+)
+
+_SECTION_SEPARATOR = "\n\n---\n\n"
+
+_INTENT_LABELS: Tuple[Tuple[str, str], ...] = (
+    ("intent:auth", "🔐 **Authentication Flow**"),
+    ("intent:search", "🔍 **Search Operation**"),
+    ("intent:ecommerce", "🛒 **E-commerce Checkout**"),
+    ("intent:form", "⌨️ **Form Input**"),
+    ("intent:navigation", "🧭 **Navigation**"),
+    ("intent:click", "👆 **Click Interaction**"),
+    ("intent:verify", "✅ **Verification/Assertion**"),
+)
+
+
+# Few-shot examples, first matching tag wins
+_EXAMPLES: Tuple[Tuple[str, str], ...] = (
+    # Login example - ENHANCED with common patterns
+    ("example:login", """# Example: Login Flow
+
+**IMPORTANT**: Use EXACT selectors from page, don't guess!
+
+```json
+{
+  "meta": {
+    "name": "User Login",
+    "description": "Login with credentials"
+  },
+  "env": {
+    "baseUrl": "http://localhost:8000"
+  },
+  "flow": [
+    {"action": "go", "url": "/demo_login.html"},
+    {"action": "type", "selector": "#username", "value": "admin"},
+    {"action": "type", "selector": "#password", "value": "password"},
+    {"action": "click", "selector": "#login-button"},
+    {"action": "see", "text": "Login successful!", "meaning": "Login successful"}
+  ]
+}
+```
+
+**Common Login Patterns**:
+- Username field: Usually `#username`, `#email`, or `[name="username"]`
+- Password field: Usually `#password` or `[name="password"]`
+- Submit button: Check exact ID (e.g., `#login-button` NOT `#login-btn`)
+- Use `text=` for buttons if ID not available (e.g., `text=Sign in`)
+"""),
+    ("example:search", """# Example: Search Flow
+
+```json
+{
+  "meta": {
+    "name": "Product Search",
+    "description": "Search for products"
+  },
+  "env": {
+    "baseUrl": "http://localhost:8000"
+  },
+  "flow": [
+    {"action": "go", "url": "/shop.html"},
+    {"action": "type", "selector": "#search-input", "value": "laptop"},
+    {"action": "click", "selector": "#search-btn"},
+    {"action": "see", "text": "Search Results", "meaning": "Results displayed"}
+  ]
+}
+```
+"""),
+    ("example:ecommerce", """# Example: E-commerce Checkout (Multi-Page)
+
+```json
+{
+  "meta": {
+    "name": "Add to Cart and Checkout",
+    "description": "Add product and proceed to checkout"
+  },
+  "env": {
+    "baseUrl": "http://localhost:8000"
+  },
+  "flow": [
+    {"action": "go", "url": "/products.html"},
+    {"action": "click", "selector": "[data-testid='add-to-cart-1']|text=Add to Cart"},
+    {"action": "see", "text": "Added to cart", "meaning": "Product added confirmation"},
+    {"action": "click", "selector": "#view-cart-btn|#cart|text=Cart"},
+    {"action": "see", "text": "Shopping Cart", "meaning": "Cart page loaded"},
+    {"action": "click", "selector": "#checkout-btn|button:has-text('Checkout')|text=Proceed to Checkout"},
+    {"action": "see", "text": "Checkout", "meaning": "Checkout page loaded"}
+  ]
+}
+```
+
+**Note**: This example uses multiple selector fallbacks for elements that might appear on different pages.
+"""),
+)
+
+# Display headings for DOM index role groups, in the order they are listed
+_ROLE_NAMES: Dict[str, str] = {
+    "button": "Buttons",
+    "input:text": "Text Inputs",
+    "input:password": "Password Inputs",
+    "input:email": "Email Inputs",
+    "input:search": "Search Inputs",
+    "link": "Links",
+    "dropdown": "Dropdowns",
+    "textarea": "Text Areas",
+}
+
+_BEST_PRACTICES = """# Best Practices & Rules
+
+## Selector Strategy (Priority Order)
+1. **#id** - BEST (most reliable, use whenever available)
+2. **[data-testid]** - GOOD (stable test selectors)
+3. **text=** - GOOD (for buttons/links with exact text)
+4. **[name]** - OK (for form inputs)
+5. **CSS classes** - AVOID (fragile, changes frequently)
+
+## Scenario Guidelines
+- ✅ Keep scenarios **under 10 steps** (simpler is better)
+- ✅ Use **exact selectors** from "Available Page Elements" section
+- ✅ Match **exact text** from page for text= selectors
+- ✅ Add **see** action after critical steps for verification
+- ❌ **DON'T guess** selectors - use provided ones
+- ❌ **DON'T add** extra verification steps unless requested
+- ❌ **DON'T use** placeholder attributes as selectors (unreliable)
+
+## Multi-Page Scenarios
+**IMPORTANT**: The "Available Page Elements" section shows elements from the INITIAL page only.
+If your test navigates to multiple pages (e.g., login → dashboard → checkout):
+
+1. **Use common patterns** for elements on other pages:
+   - Checkout buttons: `#checkout-btn`, `#checkout`, `button:has-text("Checkout")`
+   - Submit buttons: `#submit-btn`, `button[type=submit]`, `text=Submit`
+   - Back/Continue: `#back-btn`, `#continue-btn`, `text=Continue`
+   - Cart: `#cart`, `#view-cart`, `text=Cart`
+
+2. **Use multiple selector fallbacks**: `#checkout|button:has-text("Checkout")|[data-testid="checkout"]`
+
+3. **Add verification** after navigation to ensure page loaded: `{"action": "see", "text": "expected page title"}`
+
+## Action Types
+- `go` - Navigate to URL
+- `type` - Enter text (requires: selector, value)
+- `click` - Click element (requires: selector)
+- `select` - Choose dropdown option (requires: selector, value)
+- `check` - Check checkbox (requires: selector)
+- `see` - Verify text appears (requires: text, optional: meaning)
+- `seeUrl` - Verify URL contains text (requires: text)
+- `wait` - Wait milliseconds (requires: ms)
+
+## Output Format
+Return **ONLY** valid JSON with this structure:
+```json
+{
+  "meta": {"name": "...", "description": "..."},
+  "env": {"baseUrl": "..."},
+  "flow": [
+    {"action": "...", ...}
+  ]
+}
+```
+
+**No markdown fences, no explanations, just pure JSON.**
+"""
+
+
+def _compile_keywords() -> Tuple[Dict[str, FrozenSet[str]], "re.Pattern[str]"]:
+    """
+    Build a keyword -> tags table and one scanning pattern over lowercased text.
+    A keyword also carries the tags of every keyword it contains
+    (e.g. "checkout" contains "check"), so a single left-to-right pass
+    finds the same tags as testing each keyword separately.
+    """
+    direct: Dict[str, set] = {}
+    for tag, keywords in _KEYWORD_TAGS:
+        for keyword in keywords:
+            direct.setdefault(keyword, set()).add(tag)
+    keyword_tags: Dict[str, FrozenSet[str]] = {}
+    for keyword in direct:
+        tags = set()
+        for other, other_tags in direct.items():
+            if other in keyword:
+                tags |= other_tags
+        keyword_tags[keyword] = frozenset(tags)
+    # Longest first so each position reports its longest keyword; the
+    # zero-width lookahead lets matches overlap.
+    alternation = "|".join(re.escape(k) for k in sorted(direct, key=len, reverse=True))
+    return keyword_tags, re.compile(f"(?=({alternation}))")
+
+
+_KEYWORD_INDEX, _KEYWORD_RE = _compile_keywords()
+
+
+@lru_cache(maxsize=128)
+def _scan_tags(instructions: str) -> FrozenSet[str]:
+    """Tags for an instruction text; cached since retries rebuild the same prompt."""
+    tags = set()
+    # Lowercase first, as the per-keyword checks did: IGNORECASE would also match
+    # characters like "İ" or "ſ" whose lowercase is not the keyword itself.
+    for match in _KEYWORD_RE.finditer(instructions.lower()):
+        tags |= _KEYWORD_INDEX[match.group(1)]
+    return frozenset(tags)
+
+
 class ContextBuilder:
     """
     Builds rich, structured context for scenario generation agent.
@@ -40,12 +259,16 @@ class ContextBuilder:
     def __init__(self):
         self.few_shot_examples = self._load_examples()
     
+    def _detect_tags(self, instructions: str) -> FrozenSet[str]:
+        """Scan instructions once and return every matched intent/example tag."""
+        return _scan_tags(instructions)
+    
     def build_context(
         self,
         user_instructions: str,
         dom_index: List[ElementInfo],
         base_env: Dict[str, Any],
-        feedback: Optional[str] = None
+        feedback: Optional[str] = None,
     ) -> str:
         """
         Create rich, structured context for agent.
@@ -59,42 +282,50 @@ class ContextBuilder:
         Returns:
             Formatted context string for AI agent
         """
-        sections = []
+        buf = io.StringIO()
+        
+        def emit(section: str) -> None:
+            # Sections are separated by a horizontal rule
+            if buf.tell():
+                buf.write(_SECTION_SEPARATOR)
+            buf.write(section)
+        
+        tags = self._detect_tags(user_instructions)
         
         # 1. Intent Analysis
-        intent_section = self._analyze_intent(user_instructions)
+        intent_section = self._analyze_intent(user_instructions, tags)
         if intent_section:
-            sections.append(intent_section)
+            emit(intent_section)
         
         # 2. User Instructions
-        sections.append(f"# User Instructions\n\n{user_instructions}")
+        emit(f"# User Instructions\n\n{user_instructions}")
         
         # 3. Available Elements (Smart Index)
         if dom_index:
-            sections.append(self._format_dom_index(dom_index))
+            emit(self._format_dom_index(dom_index))
         
         # 4. Relevant Few-Shot Examples
-        examples = self._get_relevant_examples(user_instructions)
+        examples = self._get_relevant_examples(user_instructions, tags)
         if examples:
-            sections.append(examples)
+            emit(examples)
         
         # 5. Best Practices
-        sections.append(self._get_best_practices())
+        emit(self._get_best_practices())
         
         # 6. Environment
         env_json = json.dumps(base_env, ensure_ascii=False, indent=2)
-        sections.append(f"# Environment\n\n```json\n{env_json}\n```")
+        emit(f"# Environment\n\n```json\n{env_json}\n```")
         
         # 7. Feedback (if retry)
         if feedback:
-            sections.append(f"# Previous Attempt Feedback\n\n{feedback}")
+            emit(f"# Previous Attempt Feedback\n\n{feedback}")
         
-        return "\n\n---\n\n".join(sections)
+        return buf.getvalue()
     
-    def _analyze_intent(self, instructions: str) -> str:
+    def _analyze_intent(self, instructions: str, tags: Optional[FrozenSet[str]] = None) -> str:
         """
         Extract key patterns and intents from user instructions.
-        Regex-based, no AI needed.
+        Keyword-based, no AI needed.
         
         Detects common patterns:
           - Authentication (login, sign in)
@@ -103,37 +334,10 @@ class ContextBuilder:
           - Form filling (fill, enter, type)
           - Navigation (go to, open, click)
         """
-        instructions_lower = instructions.lower()
-        
-        detected_actions = []
-        
-        # Authentication patterns
-        if any(word in instructions_lower for word in ["login", "sign in", "log in", "authenticate"]):
-            detected_actions.append("🔐 **Authentication Flow**")
-        
-        # Search patterns
-        if any(word in instructions_lower for word in ["search", "find", "look for"]):
-            detected_actions.append("🔍 **Search Operation**")
-        
-        # E-commerce patterns
-        if any(word in instructions_lower for word in ["cart", "checkout", "purchase", "buy", "add to cart"]):
-            detected_actions.append("🛒 **E-commerce Checkout**")
-        
-        # Form filling
-        if any(word in instructions_lower for word in ["fill", "enter", "type", "input"]):
-            detected_actions.append("⌨️ **Form Input**")
-        
-        # Navigation
-        if any(word in instructions_lower for word in ["go to", "navigate", "open", "visit"]):
-            detected_actions.append("🧭 **Navigation**")
-        
-        # Click interactions
-        if any(word in instructions_lower for word in ["click", "press", "tap"]):
-            detected_actions.append("👆 **Click Interaction**")
+        if tags is None:
+            tags = self._detect_tags(instructions)
         
-        # Assertions
-        if any(word in instructions_lower for word in ["verify", "check", "ensure", "confirm"]):
-            detected_actions.append("✅ **Verification/Assertion**")
+        detected_actions = [label for tag, label in _INTENT_LABELS if tag in tags]
         
         if detected_actions:
             return "# Detected Intent\n\n" + "\n".join(detected_actions)
@@ -155,20 +359,12 @@ class ContextBuilder:
         for el in dom_index[:100]:  # Top 100 elements
             by_role.setdefault(el.role, []).append(el)
         
-        # Format each role group
-        role_names = {
-            "button": "Buttons",
-            "input:text": "Text Inputs",
-            "input:password": "Password Inputs",
-            "input:email": "Email Inputs",
-            "input:search": "Search Inputs",
-            "link": "Links",
-            "dropdown": "Dropdowns",
-            "textarea": "Text Areas",
-        }
-        
-        for role, elements in sorted(by_role.items()):
-            role_display = role_names.get(role, role.upper())
+        # Format each role group: known roles in display order, then the rest
+        ordered_roles = [role for role in _ROLE_NAMES if role in by_role]
+        ordered_roles.extend(role for role in by_role if role not in _ROLE_NAMES)
+        for role in ordered_roles:
+            elements = by_role[role]
+            role_display = _ROLE_NAMES.get(role, role.upper())
             lines.append(f"## {role_display}")
             lines.append("")
             
@@ -194,156 +390,19 @@ class ContextBuilder:
         
         return "\n".join(lines)
     
-    def _get_relevant_examples(self, instructions: str) -> str:
+    def _get_relevant_examples(self, instructions: str, tags: Optional[FrozenSet[str]] = None) -> str:
         """
         Return few-shot examples matching the detected intent.
         Helps agent learn correct output format.
         """
-        instructions_lower = instructions.lower()
-        
-        # Login example - ENHANCED with common patterns
-        if any(word in instructions_lower for word in ["login", "sign in", "authenticate"]):
-            return """# Example: Login Flow
-
-**IMPORTANT**: Use EXACT selectors from page, don't guess!
-
-```json
-{
-  "meta": {
-    "name": "User Login",
-    "description": "Login with credentials"
-  },
-  "env": {
-    "baseUrl": "http://localhost:8000"
-  },
-  "flow": [
-    {"action": "go", "url": "/demo_login.html"},
-    {"action": "type", "selector": "#username", "value": "admin"},
-    {"action": "type", "selector": "#password", "value": "password"},
-    {"action": "click", "selector": "#login-button"},
-    {"action": "see", "text": "Login successful!", "meaning": "Login successful"}
-  ]
-}
-```
-
-**Common Login Patterns**:
-- Username field: Usually `#username`, `#email`, or `[name="username"]`
-- Password field: Usually `#password` or `[name="password"]`
-- Submit button: Check exact ID (e.g., `#login-button` NOT `#login-btn`)
-- Use `text=` for buttons if ID not available (e.g., `text=Sign in`)
-"""
-        
-        # Search example
-        elif any(word in instructions_lower for word in ["search", "find"]):
-            return """# Example: Search Flow
-
-```json
-{
-  "meta": {
-    "name": "Product Search",
-    "description": "Search for products"
-  },
-  "env": {
-    "baseUrl": "http://localhost:8000"
-  },
-  "flow": [
-    {"action": "go", "url": "/shop.html"},
-    {"action": "type", "selector": "#search-input", "value": "laptop"},
-    {"action": "click", "selector": "#search-btn"},
-    {"action": "see", "text": "Search Results", "meaning": "Results displayed"}
-  ]
-}
-```
-"""
-        
-        # E-commerce example
-        elif any(word in instructions_lower for word in ["cart", "checkout", "purchase"]):
-            return """# Example: E-commerce Checkout (Multi-Page)
-
-```json
-{
-  "meta": {
-    "name": "Add to Cart and Checkout",
-    "description": "Add product and proceed to checkout"
-  },
-  "env": {
-    "baseUrl": "http://localhost:8000"
-  },
-  "flow": [
-    {"action": "go", "url": "/products.html"},
-    {"action": "click", "selector": "[data-testid='add-to-cart-1']|text=Add to Cart"},
-    {"action": "see", "text": "Added to cart", "meaning": "Product added confirmation"},
-    {"action": "click", "selector": "#view-cart-btn|#cart|text=Cart"},
-    {"action": "see", "text": "Shopping Cart", "meaning": "Cart page loaded"},
-    {"action": "click", "selector": "#checkout-btn|button:has-text('Checkout')|text=Proceed to Checkout"},
-    {"action": "see", "text": "Checkout", "meaning": "Checkout page loaded"}
-  ]
-}
-```
-
-**Note**: This example uses multiple selector fallbacks for elements that might appear on different pages.
-"""
+        if tags is None:
+            tags = self._detect_tags(instructions)
         
-        return ""
+        return next((example for tag, example in _EXAMPLES if tag in tags), "")
     
     def _get_best_practices(self) -> str:
         """Return selector strategy and best practices"""
-        return """# Best Practices & Rules
-
-## Selector Strategy (Priority Order)
-1. **#id** - BEST (most reliable, use whenever available)
-2. **[data-testid]** - GOOD (stable test selectors)
-3. **text=** - GOOD (for buttons/links with exact text)
-4. **[name]** - OK (for form inputs)
-5. **CSS classes** - AVOID (fragile, changes frequently)
-
-## Scenario Guidelines
-- ✅ Keep scenarios **under 10 steps** (simpler is better)
-- ✅ Use **exact selectors** from "Available Page Elements" section
-- ✅ Match **exact text** from page for text= selectors
-- ✅ Add **see** action after critical steps for verification
-- ❌ **DON'T guess** selectors - use provided ones
-- ❌ **DON'T add** extra verification steps unless requested
-- ❌ **DON'T use** placeholder attributes as selectors (unreliable)
-
-## Multi-Page Scenarios
-**IMPORTANT**: The "Available Page Elements" section shows elements from the INITIAL page only.
-If your test navigates to multiple pages (e.g., login → dashboard → checkout):
-
-1. **Use common patterns** for elements on other pages:
-   - Checkout buttons: `#checkout-btn`, `#checkout`, `button:has-text("Checkout")`
-   - Submit buttons: `#submit-btn`, `button[type=submit]`, `text=Submit`
-   - Back/Continue: `#back-btn`, `#continue-btn`, `text=Continue`
-   - Cart: `#cart`, `#view-cart`, `text=Cart`
-
-2. **Use multiple selector fallbacks**: `#checkout|button:has-text("Checkout")|[data-testid="checkout"]`
-
-3. **Add verification** after navigation to ensure page loaded: `{"action": "see", "text": "expected page title"}`
-
-## Action Types
-- `go` - Navigate to URL
-- `type` - Enter text (requires: selector, value)
-- `click` - Click element (requires: selector)
-- `select` - Choose dropdown option (requires: selector, value)
-- `check` - Check checkbox (requires: selector)
-- `see` - Verify text appears (requires: text, optional: meaning)
-- `seeUrl` - Verify URL contains text (requires: text)
-- `wait` - Wait milliseconds (requires: ms)
-
-## Output Format
-Return **ONLY** valid JSON with this structure:
-```json
-{
-  "meta": {"name": "...", "description": "..."},
-  "env": {"baseUrl": "..."},
-  "flow": [
-    {"action": "...", ...}
-  ]
-}
-```
-
-**No markdown fences, no explanations, just pure JSON.**
-"""
+        return _BEST_PRACTICES
     
     def _load_examples(self) -> List[Dict]:
         """Load few-shot examples from file/database (future enhancement)"""
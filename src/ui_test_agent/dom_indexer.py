@@ -14,14 +14,78 @@ Extracts and prioritizes selectors:
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List, Optional, TYPE_CHECKING
+import io
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from playwright.sync_api import Page, ElementHandle
+    from playwright.sync_api import Page
 
 
-@dataclass
+# Interactive element groups, in the order they claim the max_elements cap
+# (form fields first, so a link-heavy nav can't crowd them out)
+_INTERACTIVE_SELECTORS = ["input", "button", "a", "select", "textarea", "[role=button]", "[role=link]"]
+
+# All groups in one selector list; querySelectorAll returns each element
+# once, in document order (a <button role=button> is not repeated)
+_INTERACTIVE_SELECTOR = ", ".join(_INTERACTIVE_SELECTORS)
+
+# Attributes read verbatim for selector choice
+_ATTRIBUTE_NAMES = ["id", "data-testid", "name", "class", "type"]
+
+# Attributes passed to the AI as context; trimmed and cut to 50 chars in the browser
+_CONTEXT_ATTRIBUTE_NAMES = ["placeholder", "aria-label", "title", "value", "href"]
+
+# Walks the interactive elements in the browser and returns plain records,
+# replacing per-element get_attribute/evaluate round-trips. Visibility matches
+# Playwright's :visible (non-empty box, not visibility:hidden). Each record
+# carries the index of the first selector group its element matches.
+_COLLECT_ELEMENTS_JS = """({selector, groups, names, contextNames}) => {
+    const records = [];
+    for (const el of document.querySelectorAll(selector)) {
+        const rect = el.getBoundingClientRect();
+        if (!(rect.width > 0 && rect.height > 0)) continue;
+        if (getComputedStyle(el).visibility === 'hidden') continue;
+        const attrs = {};
+        for (const name of names) {
+            const value = el.getAttribute(name);
+            if (value !== null) attrs[name] = value;
+        }
+        const context = {};
+        for (const name of contextNames) {
+            const value = (el.getAttribute(name) || '').trim();
+            if (value) context[name] = value.slice(0, 50);
+        }
+        const text = (el.textContent || '').trim().slice(0, 50);
+        const group = groups.findIndex(sel => el.matches(sel));
+        const record = {tag: el.tagName.toLowerCase(), group, text, attrs, context};
+        if (record.tag === 'select') {
+            record.options = Array.from(el.options)
+                .map(opt => opt.text.trim())
+                .filter(text => text.length > 0)
+                .slice(0, 10);
+        }
+        records.push(record);
+    }
+    return records;
+}"""
+
+
+# Page fingerprint: URL plus a 32-bit FNV-1a hash of the body markup, so
+# same-length edits (a cart counter 1 -> 2, a class swap) still change it
+_FINGERPRINT_JS = """() => {
+    const html = document.body ? document.body.innerHTML : '';
+    let hash = 0x811c9dc5;
+    for (let i = 0; i < html.length; i++) {
+        hash ^= html.charCodeAt(i);
+        hash = Math.imul(hash, 0x01000193);
+    }
+    return location.href + '|' + html.length + '|' + (hash >>> 0).toString(16);
+}"""
+
+
+@dataclass(slots=True)
 class ElementInfo:
     """Rich element information with priority-sorted selector"""
     
@@ -30,11 +94,7 @@ class ElementInfo:
     priority: int                 # 1=highest (id), 5=lowest (CSS)
     text: Optional[str] = None    # Visible text content
     role: str = ""                # Semantic role (button, input:text, link, etc.)
-    attributes: Dict[str, str] = None  # Useful attrs (placeholder, aria-label, etc.)
-    
-    def __post_init__(self):
-        if self.attributes is None:
-            self.attributes = {}
+    attributes: Dict[str, str] = field(default_factory=dict)  # Useful attrs (placeholder, aria-label, etc.)
 
 
 class DOMSemanticIndexer:
@@ -51,6 +111,27 @@ class DOMSemanticIndexer:
     def __init__(self, page: Page):
         self.page = page
         self.elements: List[ElementInfo] = []
+        # Groupings of self.elements, rebuilt by build_index
+        self.by_role: Dict[str, List[ElementInfo]] = {}
+        self.by_priority: Dict[int, List[ElementInfo]] = {}
+        # Page fingerprint and element limit of the last build, plus its context string
+        self._built_for: Optional[Tuple[str, int]] = None
+        self._context: Optional[str] = None
+    
+    def refresh_if_changed(self, max_elements: int = 150) -> bool:
+        """
+        Rebuild the index only if the page changed since the last build.
+        Uses a fingerprint of the URL and a hash of the body markup.
+        
+        Returns:
+            True if the index was rebuilt
+        """
+        key = (self.page.evaluate(_FINGERPRINT_JS), max_elements)
+        if key == self._built_for:
+            return False
+        self.build_index(max_elements=max_elements)
+        self._built_for = key
+        return True
     
     def build_index(self, max_elements: int = 150) -> List[ElementInfo]:
         """
@@ -63,39 +144,47 @@ class DOMSemanticIndexer:
             List of ElementInfo sorted by priority (best selectors first)
         """
         self.elements = []
+        self._built_for = None
+        self._context = None
         
-        # Find all interactive elements (visible only)
-        interactive_selectors = [
-            "input:visible",
-            "button:visible", 
-            "a:visible",
-            "select:visible",
-            "textarea:visible",
-            "[role=button]:visible",
-            "[role=link]:visible",
-        ]
+        # Collect all interactive elements (visible only) in one round-trip
+        try:
+            records = self.page.evaluate(
+                _COLLECT_ELEMENTS_JS,
+                {
+                    "selector": _INTERACTIVE_SELECTOR,
+                    "groups": _INTERACTIVE_SELECTORS,
+                    "names": _ATTRIBUTE_NAMES,
+                    "contextNames": _CONTEXT_ATTRIBUTE_NAMES,
+                },
+            )
+        except Exception:
+            # Page might be loading or navigating
+            records = []
         
-        for selector in interactive_selectors:
-            try:
-                elements = self.page.query_selector_all(selector)
-                
-                for el in elements:
-                    if len(self.elements) >= max_elements:
-                        break
-                    
-                    info = self._analyze_element(el)
-                    if info:
-                        self.elements.append(info)
-            except Exception:
-                # Skip if selector fails (page might be loading)
-                continue
+        # Stable sort: group order first, document order within a group
+        records.sort(key=lambda record: record.get("group", 0))
+        
+        for record in records:
+            if len(self.elements) >= max_elements:
+                break
+            
+            info = self._analyze_element(record)
+            if info:
+                self.elements.append(info)
         
         # Sort by priority (id > data-testid > text > name > CSS)
         self.elements.sort(key=lambda x: (x.priority, x.tag))
         
+        self.by_role = {}
+        self.by_priority = {}
+        for el in self.elements:
+            self.by_role.setdefault(el.role, []).append(el)
+            self.by_priority.setdefault(el.priority, []).append(el)
+        
         return self.elements
     
-    def _analyze_element(self, el: ElementHandle) -> Optional[ElementInfo]:
+    def _analyze_element(self, record: Dict[str, Any]) -> Optional[ElementInfo]:
         """
         Extract best selector and metadata for element.
         
@@ -106,82 +195,79 @@ class DOMSemanticIndexer:
           4. [name]
           5. CSS class (fallback)
         """
-        try:
-            tag = el.evaluate("el => el.tagName.toLowerCase()")
-            text_content = el.text_content() or ""
-            text_trimmed = text_content.strip()[:50]  # First 50 chars
-            
-            # Priority 1: id
-            el_id = el.get_attribute("id")
-            if el_id and el_id.strip():
-                return ElementInfo(
-                    tag=tag,
-                    selector=f"#{el_id}",
-                    priority=1,
-                    text=text_trimmed if text_trimmed else None,
-                    role=self._get_role(el, tag),
-                    attributes=self._get_attrs(el)
-                )
-            
-            # Priority 2: data-testid
-            testid = el.get_attribute("data-testid")
-            if testid and testid.strip():
-                return ElementInfo(
-                    tag=tag,
-                    selector=f'[data-testid="{testid}"]',
-                    priority=2,
-                    text=text_trimmed if text_trimmed else None,
-                    role=self._get_role(el, tag),
-                    attributes=self._get_attrs(el)
-                )
-            
-            # Priority 3: text (for buttons/links with short, stable text)
-            if text_trimmed and tag in ["button", "a"] and len(text_trimmed) < 30:
-                return ElementInfo(
-                    tag=tag,
-                    selector=f'text={text_trimmed}',
-                    priority=3,
-                    text=text_trimmed,
-                    role=self._get_role(el, tag),
-                    attributes=self._get_attrs(el)
-                )
-            
-            # Priority 4: name
-            name = el.get_attribute("name")
-            if name and name.strip():
-                return ElementInfo(
-                    tag=tag,
-                    selector=f'[name="{name}"]',
-                    priority=4,
-                    text=text_trimmed if text_trimmed else None,
-                    role=self._get_role(el, tag),
-                    attributes=self._get_attrs(el)
-                )
-            
-            # Priority 5: CSS class (fallback, less reliable)
-            class_name = el.get_attribute("class")
-            if class_name and class_name.strip():
-                first_class = class_name.split()[0]
-                return ElementInfo(
-                    tag=tag,
-                    selector=f'.{first_class}',
-                    priority=5,
-                    text=text_trimmed if text_trimmed else None,
-                    role=self._get_role(el, tag),
-                    attributes=self._get_attrs(el)
-                )
-            
-            return None
-        except Exception:
-            # Element might be stale or inaccessible
-            return None
+        # Tags repeat across every indexed element; share one string object each
+        tag = sys.intern(record["tag"])
+        text_trimmed = record.get("text") or ""  # Trimmed to 50 chars in the browser
+        attrs = record.get("attrs") or {}
+        
+        # Priority 1: id
+        el_id = attrs.get("id")
+        if el_id and el_id.strip():
+            return ElementInfo(
+                tag=tag,
+                selector=f"#{el_id}",
+                priority=1,
+                text=text_trimmed if text_trimmed else None,
+                role=self._get_role(tag, attrs),
+                attributes=self._get_attrs(record)
+            )
+        
+        # Priority 2: data-testid
+        testid = attrs.get("data-testid")
+        if testid and testid.strip():
+            return ElementInfo(
+                tag=tag,
+                selector=f'[data-testid="{testid}"]',
+                priority=2,
+                text=text_trimmed if text_trimmed else None,
+                role=self._get_role(tag, attrs),
+                attributes=self._get_attrs(record)
+            )
+        
+        # Priority 3: text (for buttons/links with short, stable text)
+        if text_trimmed and tag in ["button", "a"] and len(text_trimmed) < 30:
+            return ElementInfo(
+                tag=tag,
+                selector=f'text={text_trimmed}',
+                priority=3,
+                text=text_trimmed,
+                role=self._get_role(tag, attrs),
+                attributes=self._get_attrs(record)
+            )
+        
+        # Priority 4: name
+        name = attrs.get("name")
+        if name and name.strip():
+            return ElementInfo(
+                tag=tag,
+                selector=f'[name="{name}"]',
+                priority=4,
+                text=text_trimmed if text_trimmed else None,
+                role=self._get_role(tag, attrs),
+                attributes=self._get_attrs(record)
+            )
+        
+        # Priority 5: CSS class (fallback, less reliable)
+        class_name = attrs.get("class")
+        if class_name and class_name.strip():
+            first_class = class_name.split()[0]
+            return ElementInfo(
+                tag=tag,
+                selector=f'.{first_class}',
+                priority=5,
+                text=text_trimmed if text_trimmed else None,
+                role=self._get_role(tag, attrs),
+                attributes=self._get_attrs(record)
+            )
+        
+        return None
     
-    def _get_role(self, el: ElementHandle, tag: str) -> str:
+    def _get_role(self, tag: str, attrs: Dict[str, str]) -> str:
         """Determine semantic role of element"""
-        el_type = el.get_attribute("type")
+        el_type = attrs.get("type")
         
         if tag == "input":
-            return f"input:{el_type or 'text'}"
+            return sys.intern(f"input:{el_type or 'text'}")
         elif tag == "button":
             return "button"
         elif tag == "a":
@@ -193,28 +279,15 @@ class DOMSemanticIndexer:
         
         return tag
     
-    def _get_attrs(self, el: ElementHandle) -> Dict[str, str]:
+    def _get_attrs(self, record: Dict[str, Any]) -> Dict[str, str]:
         """Extract useful attributes for AI context"""
-        attrs = {}
-        
-        for attr in ["placeholder", "aria-label", "title", "value", "href"]:
-            val = el.get_attribute(attr)
-            if val and val.strip():
-                attrs[attr] = val.strip()[:50]  # Limit length
+        # Already trimmed, non-empty and length-limited by the browser-side walk
+        attrs = dict(record.get("context") or {})
         
-        # For select elements, extract available options
-        try:
-            tag = el.evaluate("el => el.tagName.toLowerCase()")
-            if tag == "select":
-                options = el.evaluate("""el => {
-                    return Array.from(el.options)
-                        .map(opt => opt.text.trim())
-                        .filter(text => text.length > 0);
-                }""")
-                if options:
-                    attrs["options"] = ", ".join(options[:10])  # Limit to first 10 options
-        except Exception:
-            pass
+        # For select elements, include available options (first 10)
+        options = record.get("options")
+        if options:
+            attrs["options"] = ", ".join(options)
         
         return attrs
     
@@ -231,32 +304,43 @@ class DOMSemanticIndexer:
             text=Cart (2) → "Cart (2)"
             [data-testid="checkout-btn"] → "Proceed to Checkout"
         """
+        if self._context is not None:
+            return self._context
+        
         if not self.elements:
             return "# No interactive elements found on page"
         
-        lines = ["# Page Elements (Priority-Sorted)", ""]
+        buf = io.StringIO()
+        buf.write("# Page Elements (Priority-Sorted)\n")
         
         for el in self.elements[:100]:  # Top 100 elements
             # Build line: selector [text] [attributes]
-            line_parts = [el.selector]
+            buf.write("\n")
+            buf.write(el.selector)
             
             if el.text:
-                line_parts.append(f'→ "{el.text}"')
+                buf.write(f' → "{el.text}"')
             
-            if el.attributes.get("placeholder"):
-                line_parts.append(f'[placeholder: {el.attributes["placeholder"]}]')
+            placeholder = el.attributes.get("placeholder")
+            if placeholder:
+                buf.write(f" [placeholder: {placeholder}]")
             
-            if el.attributes.get("aria-label"):
-                line_parts.append(f'[aria-label: {el.attributes["aria-label"]}]')
-            
-            lines.append(" ".join(line_parts))
+            aria_label = el.attributes.get("aria-label")
+            if aria_label:
+                buf.write(f" [aria-label: {aria_label}]")
         
-        return "\n".join(lines)
+        self._context = buf.getvalue()
+        return self._context
     
     def get_by_role(self, role: str) -> List[ElementInfo]:
         """Get all elements of specific role (e.g., 'button', 'input:text')"""
-        return [el for el in self.elements if el.role == role]
+        return self.by_role.get(role, [])
     
     def get_by_priority(self, max_priority: int = 3) -> List[ElementInfo]:
         """Get only high-priority elements (1-3: id, data-testid, text)"""
-        return [el for el in self.elements if el.priority <= max_priority]
+        return [
+            el
+            for priority in sorted(self.by_priority)
+            if priority <= max_priority
+            for el in self.by_priority[priority]
+        ]
@@ -16,15 +16,19 @@ from __future__ import annotations
 import json
 import logging
 import os
+import re
 import warnings
+from collections import deque
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
-from playwright.sync_api import Page
+from playwright.sync_api import Browser, Page
 
 from .config import Settings
 from .dom_indexer import DOMSemanticIndexer
 
+log = logging.getLogger("ui_test_agent.dynamic_nl_agent")
+
 # Suppress Google warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="google")
 for logger_name in ["google", "google.genai", "google.adk"]:
@@ -36,6 +40,94 @@ except ImportError:
     genai = None
 
 
+# Invariant part of the decision prompt, sent once as the model's system
+# instruction so only goal/state/DOM/history travel with each step
+_SYSTEM_INSTRUCTION = """You are a web automation agent working towards the user's GOAL.
+
+TASK: Decide the NEXT ACTIONS (1 to {max_batch}) to get closer to the goal.
+Only batch actions whose elements are ALL listed under AVAILABLE ELEMENTS; an action
+that navigates or changes the page must be the last one in the batch.
+
+CRITICAL RULES:
+1. CAREFULLY CHECK previous steps - if ALL required fields are filled and form is submitted, return "done"
+2. DON'T REPEAT filling the same field multiple times (check history!)
+3. If you see a success notification in previous steps, the goal IS COMPLETE - return "done"
+4. If the same selector appears multiple times in history with type/select actions, SKIP IT
+5. Work through the goal sequentially - don't jump around filling fields randomly
+
+ACTION TYPES:
+- go: Navigate to URL (use "value" field for URL)
+- type: Enter text into input field (requires "selector" and "value")
+- click: Click button/link (requires "selector")
+- select: Choose dropdown option (requires "selector" and "value" with option value/text)
+- see: Verify text appears (use "value" field for text to check)
+- done: Goal achieved, stop immediately
+
+OUTPUT FORMAT:
+{{
+  "actions": [
+    {{
+      "action": "click|type|go|select|see|done",
+      "selector": "#id|selector (if click/type/select)",
+      "value": "text to type OR url to visit OR text to verify OR option to select",
+      "expect_url": "substring the URL should contain after this action (optional)",
+      "final": true only on a "see" that verifies the WHOLE goal is complete (optional),
+      "reasoning": "why this action"
+    }}
+  ]
+}}
+
+IMPORTANT: 
+- Before typing/selecting, check if that exact selector was already used in previous steps
+- Mark a "see" with "final": true only when it checks the end result of the whole goal;
+  intermediate checks (e.g. a welcome text before further steps) are not final
+- Complete the form ONCE, then submit, then verify, then DONE"""
+
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Case-insensitive check that text is rendered anywhere on the page
+_TEXT_VISIBLE_JS = """text => !!document.body &&
+    document.body.innerText.toLowerCase().includes(text.toLowerCase())"""
+
+# Resolves once the DOM has had no mutations for quietMs (or after maxMs),
+# so the next observation sees the result of a click instead of the old page
+_DOM_QUIET_JS = """([quietMs, maxMs]) => new Promise(resolve => {
+    let timer = null;
+    const finish = () => { observer.disconnect(); clearTimeout(timer); clearTimeout(cap); resolve(true); };
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(finish, quietMs);
+    });
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    timer = setTimeout(finish, quietMs);
+    const cap = setTimeout(finish, maxMs);
+})"""
+
+# JSON mode schema for decisions; guarantees parseable output without fences
+_DECISION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "actions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "action": {"type": "string"},
+                    "selector": {"type": "string"},
+                    "value": {"type": "string"},
+                    "expect_url": {"type": "string"},
+                    "final": {"type": "boolean"},
+                    "reasoning": {"type": "string"},
+                },
+                "required": ["action"],
+            },
+        },
+    },
+    "required": ["actions"],
+}
+
+
 @dataclass
 class ActionStep:
     """Single action decided by agent"""
@@ -44,6 +136,8 @@ class ActionStep:
     value: Optional[str] = None
     text: Optional[str] = None
     reasoning: Optional[str] = None
+    expect_url: Optional[str] = None  # URL substring expected after this action
+    final: bool = False  # A "see" that verifies the whole goal
 
 
 class DynamicNLAgent:
@@ -53,21 +147,68 @@ class DynamicNLAgent:
     Usage:
         agent = DynamicNLAgent(settings, page)
         result = agent.execute_goal("Login as admin and add product to cart")
+        
+        # Several independent goals on one browser
+        results = DynamicNLAgent.execute_goals(settings, browser, goals)
     """
     
-    def __init__(self, settings: Settings, page: Page):
+    def __init__(self, settings: Settings, page: Page, model: Any = None):
         self.settings = settings
         self.page = page
         self.max_steps = 20  # Safety limit (increased for complex flows)
+        self.max_batch = 3  # Actions planned per LLM call
         self.history: List[Dict[str, Any]] = []
+        # Prompt form of the last 8 steps (action, encoded entry), plus
+        # per-action counts of the steps that fell out of the window
+        self._history_ring: Deque[Tuple[str, str]] = deque(maxlen=8)
+        self._older_counts: Dict[str, int] = {}
+        # One indexer per page; it skips rebuilding while the page is unchanged
+        self._indexer = DOMSemanticIndexer(page)
+        self._dispatch: Dict[str, Callable[[ActionStep], None]] = {
+            "go": self._do_go,
+            "type": self._do_type,
+            "click": self._do_click,
+            "select": self._do_select,
+            "see": self._do_see,
+            "done": self._do_done,
+        }
         
-        if genai and settings.gemini_api_key:
+        if model is not None:
+            self.model = model
+        elif genai and settings.gemini_api_key:
             genai.configure(api_key=settings.gemini_api_key)
             model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-            self.model = genai.GenerativeModel(model_name)
+            self.model = genai.GenerativeModel(
+                model_name,
+                system_instruction=_SYSTEM_INSTRUCTION.format(max_batch=self.max_batch),
+                generation_config={
+                    "response_mime_type": "application/json",
+                    "response_schema": _DECISION_SCHEMA,
+                },
+            )
         else:
             self.model = None
     
+    @classmethod
+    def execute_goals(cls, settings: Settings, browser: Browser, goals: List[str]) -> List[Dict[str, Any]]:
+        """
+        Run several independent goals on one shared browser, each in a fresh
+        BrowserContext (isolated cookies/storage) and sharing one Gemini model.
+        Goals run one after another: Playwright's sync API must stay on the
+        thread that started it, so contexts are not driven from worker threads.
+        """
+        results: List[Dict[str, Any]] = []
+        model = None
+        for goal in goals:
+            context = browser.new_context()
+            try:
+                agent = cls(settings, context.new_page(), model=model)
+                model = agent.model
+                results.append(agent.execute_goal(goal))
+            finally:
+                context.close()
+        return results
+    
     def execute_goal(self, goal: str) -> Dict[str, Any]:
         """
         Execute high-level goal by making step-by-step decisions.
@@ -85,53 +226,66 @@ class DynamicNLAgent:
                 "steps": []
             }
         
-        print(f"[dynamic-agent] Goal: {goal}")
-        print(f"[dynamic-agent] Starting at: {self.page.url}")
+        log.info("Goal: %s (starting at %s)", goal, self.page.url)
         
         self.history = []
+        self._history_ring.clear()
+        self._older_counts = {}
         steps_taken = 0
+        pending: Deque[ActionStep] = deque()
         
         while steps_taken < self.max_steps:
-            # 1. Observe current page
-            dom_context = self._get_current_dom()
-            page_url = self.page.url
-            page_title = self.page.title()
+            if not pending and self._verified_last_step():
+                # A successful final "see" with nothing left in the plan ends the goal;
+                # skip the extra LLM round-trip that would only answer "done"
+                pending.append(ActionStep(action="done", reasoning="auto: final see succeeded"))
             
-            # 2. Ask agent: "What should I do next?"
-            next_action = self._decide_next_action(
-                goal=goal,
-                current_url=page_url,
-                page_title=page_title,
-                dom_context=dom_context,
-                history=self.history
-            )
+            if not pending:
+                # 1. Observe current page
+                dom_context = self._get_current_dom()
+                page_url = self.page.url
+                page_title = self.page.title()
+                
+                # 2. Ask agent: "What should I do next?" (a few actions at once)
+                pending.extend(self._decide_next_action(
+                    goal=goal,
+                    current_url=page_url,
+                    page_title=page_title,
+                    dom_context=dom_context,
+                    history=self.history
+                ))
+                
+                if not pending:
+                    return {
+                        "status": "error",
+                        "message": "Agent couldn't decide next action",
+                        "steps": self.history
+                    }
             
-            if not next_action:
-                return {
-                    "status": "error",
-                    "message": "Agent couldn't decide next action",
-                    "steps": self.history
-                }
+            next_action = pending.popleft()
+            url_before = self.page.url
             
             # 3. Execute action
-            print(f"[dynamic-agent] Step {steps_taken + 1}: {next_action.action}")
             if next_action.reasoning:
-                print(f"[dynamic-agent] Reasoning: {next_action.reasoning}")
+                log.info("Step %d: %s (%s)", steps_taken + 1, next_action.action, next_action.reasoning)
+            else:
+                log.info("Step %d: %s", steps_taken + 1, next_action.action)
             
             try:
                 self._execute_action(next_action)
-                self.history.append({
+                self._record_step({
                     "step": steps_taken + 1,
                     "action": next_action.action,
                     "selector": next_action.selector,
                     "value": next_action.value,
                     "status": "success",
                     "url": self.page.url,
-                    "reasoning": next_action.reasoning
+                    "reasoning": next_action.reasoning,
+                    "final": next_action.final,
                 })
             except Exception as exc:
-                print(f"[dynamic-agent] Action failed: {exc}")
-                self.history.append({
+                log.warning("Action failed: %s", exc)
+                self._record_step({
                     "step": steps_taken + 1,
                     "action": next_action.action,
                     "status": "failed",
@@ -145,7 +299,7 @@ class DynamicNLAgent:
             
             # 4. Check if goal achieved
             if next_action.action == "done":
-                print(f"[dynamic-agent] Goal achieved in {steps_taken + 1} steps!")
+                log.info("Goal achieved in %d steps!", steps_taken + 1)
                 return {
                     "status": "success",
                     "message": "Goal achieved",
@@ -153,6 +307,12 @@ class DynamicNLAgent:
                 }
             
             steps_taken += 1
+            
+            # Queued actions were planned against the previous page state;
+            # replan if the page moved somewhere the plan did not predict
+            if pending and self._diverged(next_action, url_before):
+                log.info("Page state diverged from plan, re-planning")
+                pending.clear()
         
         return {
             "status": "timeout",
@@ -160,6 +320,41 @@ class DynamicNLAgent:
             "steps": self.history
         }
     
+    def _verified_last_step(self) -> bool:
+        last = self.history[-1] if self.history else None
+        return bool(
+            last
+            and last.get("action") == "see"
+            and last.get("status") == "success"
+            and last.get("final")
+        )
+    
+    def _record_step(self, item: Dict[str, Any]) -> None:
+        """Append a step to history and to the rolling prompt window."""
+        self.history.append(item)
+        ring = self._history_ring
+        if len(ring) == ring.maxlen:
+            evicted = ring[0][0]
+            self._older_counts[evicted] = self._older_counts.get(evicted, 0) + 1
+        ring.append((item.get("action") or "?", _compact_entry(item)))
+    
+    def _history_prompt(self) -> str:
+        """Last 8 steps as a JSON array, older steps folded into one summary line."""
+        encoded = "[" + ",".join(entry for _, entry in self._history_ring) + "]"
+        if not self._older_counts:
+            return encoded
+        older = sum(self._older_counts.values())
+        summary = ", ".join(f"{action} x{count}" for action, count in self._older_counts.items())
+        return f"Progress so far: {older} earlier steps ({summary})\n{encoded}"
+    
+    def _diverged(self, action: ActionStep, url_before: str) -> bool:
+        """True when the page no longer matches what the planned batch assumed."""
+        current_url = self.page.url
+        if action.expect_url:
+            return action.expect_url not in current_url
+        # Unpredicted navigation invalidates selectors planned for the old page
+        return current_url != url_before
+    
     def _get_current_dom(self) -> str:
         """Extract current page DOM context"""
         try:
@@ -167,11 +362,11 @@ class DynamicNLAgent:
             if not self.page or self.page.is_closed():
                 return "# Page closed or unavailable"
             
-            indexer = DOMSemanticIndexer(self.page)
-            elements = indexer.build_index(max_elements=50)
-            return indexer.to_context_string()
+            # Reuse the last index while URL and markup are unchanged
+            self._indexer.refresh_if_changed(max_elements=50)
+            return self._indexer.to_context_string()
         except Exception as exc:
-            print(f"[dynamic-agent] DOM extraction failed: {exc}")
+            log.warning("DOM extraction failed: %s", exc)
             return "# DOM extraction failed - page may be transitioning"
     
     def _decide_next_action(
@@ -181,146 +376,249 @@ class DynamicNLAgent:
         page_title: str,
         dom_context: str,
         history: List[Dict[str, Any]]
-    ) -> Optional[ActionStep]:
+    ) -> List[ActionStep]:
         """
-        Ask LLM: "Given current page state, what's the next action to achieve goal?"
+        Ask LLM: "Given current page state, what are the next actions to achieve goal?"
+        Returns up to max_batch actions to run in order; empty list on failure.
         """
         # Show more history to avoid repeating actions
-        history_str = json.dumps(history[-8:], indent=2) if history else "None"
+        history_str = self._history_prompt() if history else "None"
+        dom_context = _trim_dom(dom_context, goal)
         
-        prompt = f"""You are a web automation agent. Your goal: {goal}
+        # Rules, action types and output format live in the system instruction
+        prompt = f"""GOAL: {goal}
 
 CURRENT STATE:
 - URL: {current_url}
 - Page Title: {page_title}
-- Previous Steps (Last 8): {history_str}
+- Previous Steps (Last 8; s=step, a=action, sel=selector, v=value, ok=succeeded): {history_str}
 
 AVAILABLE ELEMENTS:
 {dom_context}
 
-TASK: Decide the NEXT SINGLE ACTION to get closer to the goal.
-
-CRITICAL RULES:
-1. CAREFULLY CHECK previous steps - if ALL required fields are filled and form is submitted, return "done"
-2. DON'T REPEAT filling the same field multiple times (check history!)
-3. If you see a success notification in previous steps, the goal IS COMPLETE - return "done"
-4. If the same selector appears multiple times in history with type/select actions, SKIP IT
-5. Work through the goal sequentially - don't jump around filling fields randomly
-
-ACTION TYPES:
-- go: Navigate to URL (use "value" field for URL)
-- type: Enter text into input field (requires "selector" and "value")
-- click: Click button/link (requires "selector")
-- select: Choose dropdown option (requires "selector" and "value" with option value/text)
-- see: Verify text appears (use "value" field for text to check)
-- done: Goal achieved, stop immediately
-
-OUTPUT FORMAT (JSON only, no markdown):
-{{
-  "action": "click|type|go|select|see|done",
-  "selector": "#id|selector (if click/type/select)",
-  "value": "text to type OR url to visit OR text to verify OR option to select",
-  "reasoning": "why this action"
-}}
-
-IMPORTANT: 
-- Before typing/selecting, check if that exact selector was already used in previous steps
-- After "see" verification succeeds, usually the goal is DONE
-- Complete the form ONCE, then submit, then verify, then DONE
-
 RESPOND WITH JSON ONLY:"""
         
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+            # Stream and stop as soon as the first complete JSON object arrives
+            buffer = ""
+            response_text = None
+            for chunk in self.model.generate_content(prompt, stream=True):
+                buffer += chunk.text or ""
+                response_text = _first_json_object(buffer)
+                if response_text is not None:
+                    break
             
-            # Clean markdown fences
-            if response_text.startswith("```"):
-                lines = response_text.split("\n")
-                response_text = "\n".join([l for l in lines if not l.strip().startswith("```")])
+            if response_text is None:
+                response_text = buffer
             
-            # Parse JSON
+            # Parse JSON (a bare single action object is accepted too)
             data = json.loads(response_text)
+            items = data.get("actions") if isinstance(data, dict) and "actions" in data else data
+            if isinstance(items, dict):
+                items = [items]
             
-            return ActionStep(
-                action=data.get("action", "done"),
-                selector=data.get("selector"),
-                value=data.get("value"),
-                text=data.get("text"),
-                reasoning=data.get("reasoning")
-            )
+            return [
+                ActionStep(
+                    action=item.get("action", "done"),
+                    selector=item.get("selector"),
+                    value=item.get("value"),
+                    text=item.get("text"),
+                    reasoning=item.get("reasoning"),
+                    expect_url=item.get("expect_url"),
+                    final=bool(item.get("final")),
+                )
+                for item in items[:self.max_batch]
+            ]
         except Exception as exc:
-            print(f"[dynamic-agent] Decision failed: {exc}")
-            return None
+            log.warning("Decision failed: %s", exc)
+            return []
     
     def _execute_action(self, action: ActionStep) -> None:
         """Execute the decided action"""
-        if action.action == "go":
-            url = action.value or action.selector
-            if not url:
-                raise ValueError("go action requires URL in 'value' field")
-            self.page.goto(url, wait_until="networkidle", timeout=10000)
-        
-        elif action.action == "type":
-            if not action.selector:
-                raise ValueError("type action requires selector")
-            if not action.value:
-                raise ValueError("type action requires value")
-            locator = self.page.locator(action.selector).first
-            locator.wait_for(state="visible", timeout=8000)
-            locator.fill(action.value)
-        
-        elif action.action == "click":
-            if not action.selector:
-                raise ValueError("click action requires selector")
-            locator = self.page.locator(action.selector).first
-            locator.wait_for(state="visible", timeout=8000)
-            locator.click()
-            # Wait a bit after click for page updates (e.g., modals, notifications)
-            self.page.wait_for_timeout(800)
-        
-        elif action.action == "select":
-            if not action.selector:
-                raise ValueError("select action requires selector")
-            if not action.value:
-                raise ValueError("select action requires value (option to select)")
-            # Use Playwright's select_option for dropdowns
-            select = self.page.locator(action.selector).first
-            select.wait_for(state="visible", timeout=8000)
-            # Try label first (e.g., "Engineering"), then value (e.g., "engineering")
+        handler = self._dispatch.get(action.action)
+        if handler is None:
+            raise ValueError(f"Unknown action: {action.action}")
+        handler(action)
+    
+    def _do_go(self, action: ActionStep) -> None:
+        """Navigate to a URL"""
+        url = action.value or action.selector
+        if not url:
+            raise ValueError("go action requires URL in 'value' field")
+        self.page.goto(url, wait_until="domcontentloaded", timeout=10000)
+        self._settle()
+    
+    def _do_type(self, action: ActionStep) -> None:
+        """Fill an input"""
+        if not action.selector:
+            raise ValueError("type action requires selector")
+        if not action.value:
+            raise ValueError("type action requires value")
+        locator = self.page.locator(action.selector).first
+        locator.wait_for(state="visible", timeout=8000)
+        locator.fill(action.value)
+    
+    def _do_click(self, action: ActionStep) -> None:
+        """Click an element"""
+        if not action.selector:
+            raise ValueError("click action requires selector")
+        locator = self.page.locator(action.selector).first
+        locator.wait_for(state="visible", timeout=8000)
+        locator.click()
+        self._settle()
+    
+    def _do_select(self, action: ActionStep) -> None:
+        """Choose a dropdown option"""
+        if not action.selector:
+            raise ValueError("select action requires selector")
+        if not action.value:
+            raise ValueError("select action requires value (option to select)")
+        # Use Playwright's select_option for dropdowns
+        select = self.page.locator(action.selector).first
+        select.wait_for(state="visible", timeout=8000)
+        if select.get_attribute("multiple") is None:
+            # Match by label (e.g., "Engineering") or value (e.g., "engineering" or as-is)
+            # in one call; the first option matching any candidate is selected
+            select.select_option(
+                value=list(dict.fromkeys([action.value, action.value.lower()])),
+                label=action.value,
+                timeout=5000,
+            )
+        else:
+            # A <select multiple> must match every candidate given at once,
+            # so try label, then lowercase value, then value as-is
             try:
                 select.select_option(label=action.value, timeout=5000)
             except Exception:
                 try:
                     select.select_option(value=action.value.lower(), timeout=5000)
                 except Exception:
-                    # Last resort: try value as-is
                     select.select_option(value=action.value, timeout=5000)
-            # Wait longer after dropdown selection to let any JS handlers complete
-            self.page.wait_for_timeout(800)
-        
-        elif action.action == "see":
-            # Try value first, then text field
-            text_to_verify = action.value or action.text
-            if not text_to_verify:
-                raise ValueError("see action requires text in 'value' field")
-            # For dynamic elements (like notifications), check if text exists in DOM first
-            # Then try to wait for visibility (with shorter timeout for transient elements)
-            locator = self.page.get_by_text(text_to_verify, exact=False)
+        self._settle()
+    
+    def _settle(self) -> None:
+        """
+        Wait for the page to react to the last action before it is observed:
+        a started navigation is awaited to domcontentloaded, in-page updates
+        (fetch results, JS rendering) until the DOM is quiet for 200ms (max 2s).
+        """
+        for _ in range(2):
             try:
-                locator.wait_for(state="attached", timeout=2000)  # Just check if exists in DOM
-                # Try to wait for visibility, but don't fail if it's transient
-                try:
-                    locator.wait_for(state="visible", timeout=3000)
-                except Exception:
-                    # Element exists but may be hidden/transient - that's OK for notifications
-                    print(f"[dynamic-agent] Text '{text_to_verify}' found in DOM (may be hidden/transient)")
+                self.page.wait_for_load_state("domcontentloaded", timeout=10000)
+                self.page.evaluate(_DOM_QUIET_JS, [200, 2000])
+                return
             except Exception:
-                # Not found at all - fail
-                locator.wait_for(state="visible", timeout=8000)
-        
-        elif action.action == "done":
-            pass  # Goal achieved
-        
-        else:
-            raise ValueError(f"Unknown action: {action.action}")
+                # The document was replaced mid-wait (JS navigation); wait on the new one
+                continue
+    
+    def _do_see(self, action: ActionStep) -> None:
+        """Verify text appears on the page"""
+        # Try value first, then text field
+        text_to_verify = action.value or action.text
+        if not text_to_verify:
+            raise ValueError("see action requires text in 'value' field")
+        # Fast path: one in-page poll for the text among the rendered page text
+        try:
+            self.page.wait_for_function(
+                _TEXT_VISIBLE_JS, arg=text_to_verify, timeout=3000, polling=100
+            )
+            return
+        except Exception:
+            pass
+        # For dynamic elements (like notifications), check if text exists in DOM first
+        # Then try to wait for visibility (with shorter timeout for transient elements)
+        locator = self.page.get_by_text(text_to_verify, exact=False)
+        try:
+            locator.wait_for(state="attached", timeout=2000)  # Just check if exists in DOM
+            # Try to wait for visibility, but don't fail if it's transient
+            try:
+                locator.wait_for(state="visible", timeout=3000)
+            except Exception:
+                # Element exists but may be hidden/transient - that's OK for notifications
+                log.info("Text '%s' found in DOM (may be hidden/transient)", text_to_verify)
+        except Exception:
+            # Not found at all - fail
+            locator.wait_for(state="visible", timeout=8000)
+    
+    def _do_done(self, action: ActionStep) -> None:
+        """Goal achieved, nothing to do"""
+        pass
+
+
+def _first_json_object(text: str) -> Optional[str]:
+    """Return the first balanced top-level {...} in text, or None if not complete yet."""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    return None
+
+
+def _trim_dom(dom_context: str, goal: str, budget_chars: int = 8000) -> str:
+    """
+    Bound the DOM context to roughly budget_chars (~2000 tokens at 4 chars/token).
+    When over budget, keep heading lines plus the element lines sharing the most
+    words with the goal, in their original order.
+    """
+    if len(dom_context) <= budget_chars:
+        return dom_context
+    
+    goal_words = {word for word in _WORD_PATTERN.findall(goal.lower()) if len(word) > 2}
+    lines = dom_context.splitlines()
+    headings = [index for index, line in enumerate(lines) if line.startswith("# ")]
+    used = sum(len(lines[index]) + 1 for index in headings)
+    
+    scored = []
+    for index, line in enumerate(lines):
+        if line.startswith("# ") or len(line) < 8:
+            continue
+        overlap = len(goal_words.intersection(_WORD_PATTERN.findall(line.lower())))
+        scored.append((-overlap, index))
+    scored.sort()
+    
+    keep = set(headings)
+    for _, index in scored:
+        cost = len(lines[index]) + 1
+        if used + cost > budget_chars:
+            continue
+        keep.add(index)
+        used += cost
+    return "\n".join(lines[index] for index in sorted(keep))
+
+
+def _truncate(value: Any, limit: int = 40) -> Any:
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit - 3] + "..."
+    return value
+
+
+def _compact_entry(item: Dict[str, Any]) -> str:
+    """Encode one history step as compact JSON with short keys (no url/reasoning)."""
+    entry: Dict[str, Any] = {"s": item.get("step"), "a": item.get("action")}
+    if item.get("selector"):
+        entry["sel"] = _truncate(item["selector"])
+    if item.get("value"):
+        entry["v"] = _truncate(item["value"])
+    entry["ok"] = item.get("status") == "success"
+    if item.get("error"):
+        entry["err"] = _truncate(item["error"])
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
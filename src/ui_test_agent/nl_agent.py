@@ -1,14 +1,21 @@
 from __future__ import annotations
 
+import asyncio
+import atexit
+import contextlib
+import hashlib
 import json
 import logging
 import os
 import re
+import threading
 import time
 import warnings
+from collections import OrderedDict
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from .config import Settings
 from .dom_indexer import DOMSemanticIndexer
@@ -32,6 +39,55 @@ except ImportError:  # pragma: no cover
     InMemoryRunner = None  # type: ignore
     types = None  # type: ignore
 
+try:  # pragma: no cover - optional dependency
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+# System instruction of the scenario builder agent (static, shared by all builds)
+_SCENARIO_BUILDER_INSTRUCTION = """
+You are an expert test scenario builder. You receive structured context including:
+  1. User's intent analysis (detected patterns)
+  2. Available page elements with priority-sorted selectors
+  3. Few-shot examples matching the use case
+  4. Best practices and rules
+
+Your task: Generate a JSON test scenario using the PROVIDED selectors.
+
+CRITICAL RULES:
+- Use EXACT selectors from "Available Page Elements" section
+- DON'T guess or invent selectors not in the list
+- Prefer #id > [data-testid] > text= > [name]
+- Keep scenarios under 10 steps (simpler is better)
+- Return ONLY valid JSON (no markdown, no explanations, no code fences)
+
+OUTPUT FORMAT:
+{
+  "meta": {"name": "...", "description": "..."},
+  "env": {"baseUrl": "..."},
+  "flow": [
+    {"action": "go", "url": "/page.html"},
+    {"action": "type", "selector": "#input-id", "value": "text"},
+    {"action": "click", "selector": "text=Button"},
+    {"action": "see", "text": "Success", "meaning": "Verification"}
+  ]
+}
+
+Remember: Use selectors from the provided list, don't invent new ones!
+"""
+
+# Markdown code block wrapping a JSON object, see _extract_final_json()
+_JSON_BLOCK_PATTERN = re.compile(r'```(?:json)?\s*\n(\{.*?\})\s*\n```', re.DOTALL | re.IGNORECASE)
+# text("...") / text('...') selector forms
+_TEXT_CALL_PREFIXES = ('text("', "text('")
+
+# Shared event loop for ADK coroutines: (loop, thread), started lazily by _get_loop()
+_LOOP_THREAD: Optional[Tuple[asyncio.AbstractEventLoop, threading.Thread]] = None
+_LOOP_LOCK = threading.Lock()
+# Cached InMemoryRunner per model name, see _get_runner()
+_RUNNERS: Dict[str, Any] = {}
+_RUNNERS_LOCK = threading.Lock()
+
 
 # ===== Scenario Dataclass (previously in dsl.py) =====
 
@@ -49,16 +105,24 @@ class ScenarioError(RuntimeError):
 
 def deep_merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
     """Recursively merge two dictionaries, with override taking precedence."""
-    result = dict(base)
-    for key, value in override.items():
-        if (
-            key in result
-            and isinstance(result[key], dict)
-            and isinstance(value, dict)
-        ):
-            result[key] = deep_merge(result[key], value)
-        else:
-            result[key] = value
+    if not override:
+        return dict(base)
+    if not base:
+        return dict(override)
+    result = {**base}
+    # (merged copy, override) pairs still to apply, one per nested level
+    pending = [(result, override)]
+    while pending:
+        target, source = pending.pop()
+        for key, value in source.items():
+            if isinstance(value, dict):
+                current = target.get(key)
+                if isinstance(current, dict):
+                    merged = {**current}
+                    target[key] = merged
+                    pending.append((merged, value))
+                    continue
+            target[key] = value
     return result
 
 
@@ -73,35 +137,61 @@ class GeneratedScenario:
     scenario: Scenario
     raw_plan: Dict[str, Any]
     transcript: List[TranscriptEntry]
+    # Plan cache entry this scenario came from or was stored under, if any
+    plan_cache_key: Optional[str] = None
 
 
 class NaturalLanguageOrchestrator:
     """Turns natural language prompts into executable scenarios using hybrid approach."""
 
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, use_plan_cache: bool = True):
         self.settings = settings
         self._adk_available = Agent is not None and InMemoryRunner is not None and types is not None
         self.context_builder = ContextBuilder()  # NEW: Stage 2 context builder
-        # DOM cache: url -> (snapshot, timestamp)
-        self._dom_cache: Dict[str, Tuple[str, float]] = {}
+        # DOM cache: url -> (snapshot, monotonic deadline), least recently used first
+        self._dom_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
         self._dom_cache_ttl: int = 300  # 5 minutes TTL
+        self._dom_cache_size: int = 128
+        # Plan cache: artifacts/plan_cache/<sha256>.json
+        self._plan_cache_ttl: int = 86400  # 24 hours TTL
+        self._use_plan_cache = use_plan_cache
+
+    def __enter__(self) -> "NaturalLanguageOrchestrator":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Release state owned by this orchestrator.
+        The ADK runners and event loop are shared by every instance, so
+        they are left running and torn down at interpreter exit.
+        """
+        self._dom_cache.clear()
 
     def get_cached_dom(self, url: str) -> Optional[str]:
         """
         Get cached DOM snapshot if available and not expired.
         Returns None if cache miss or expired.
         """
-        if url in self._dom_cache:
-            snapshot, timestamp = self._dom_cache[url]
-            if time.time() - timestamp < self._dom_cache_ttl:
-                return snapshot
-            # Expired, remove from cache
-            del self._dom_cache[url]
+        entry = self._dom_cache.get(url)
+        if entry is None:
+            return None
+        snapshot, deadline = entry
+        if time.monotonic() < deadline:
+            self._dom_cache.move_to_end(url)
+            return snapshot
+        # Expired, remove from cache
+        del self._dom_cache[url]
         return None
     
     def cache_dom(self, url: str, snapshot: str) -> None:
-        """Store DOM snapshot in cache with current timestamp."""
-        self._dom_cache[url] = (snapshot, time.time())
+        """Store DOM snapshot in cache, evicting the least recently used entry when full."""
+        self._dom_cache[url] = (snapshot, time.monotonic() + self._dom_cache_ttl)
+        self._dom_cache.move_to_end(url)
+        if len(self._dom_cache) > self._dom_cache_size:
+            self._dom_cache.popitem(last=False)
 
     def build(
         self,
@@ -138,56 +228,6 @@ class NaturalLanguageOrchestrator:
 
         model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
-        # HYBRID APPROACH: Single agent with rich context from ContextBuilder
-        # No multi-agent orchestration - simpler, faster, more reliable
-        
-        single_agent = Agent(
-            name="scenario_builder",
-            description="Builds complete test scenarios from natural language with rich context",
-            instruction="""
-You are an expert test scenario builder. You receive structured context including:
-  1. User's intent analysis (detected patterns)
-  2. Available page elements with priority-sorted selectors
-  3. Few-shot examples matching the use case
-  4. Best practices and rules
-
-Your task: Generate a JSON test scenario using the PROVIDED selectors.
-
-CRITICAL RULES:
-- Use EXACT selectors from "Available Page Elements" section
-- DON'T guess or invent selectors not in the list
-- Prefer #id > [data-testid] > text= > [name]
-- Keep scenarios under 10 steps (simpler is better)
-- Return ONLY valid JSON (no markdown, no explanations, no code fences)
-
-OUTPUT FORMAT:
-{
-  "meta": {"name": "...", "description": "..."},
-  "env": {"baseUrl": "..."},
-  "flow": [
-    {"action": "go", "url": "/page.html"},
-    {"action": "type", "selector": "#input-id", "value": "text"},
-    {"action": "click", "selector": "text=Button"},
-    {"action": "see", "text": "Success", "meaning": "Verification"}
-  ]
-}
-
-Remember: Use selectors from the provided list, don't invent new ones!
-""",
-            model=model_name,
-        )
-
-        runner = InMemoryRunner(agent=single_agent, app_name="agents")
-        
-        # Use async session creation (create_session_sync is deprecated)
-        async def _create_session():
-            return await runner.session_service.create_session(
-                app_name=runner.app_name,
-                user_id="local-user",
-            )
-        
-        session = _run_sync(_create_session())
-
         # HYBRID: Build rich context with DOM elements
         # dom_context is already formatted string from DOMSemanticIndexer
         # Pass it directly as raw context since context_builder expects ElementInfo list
@@ -205,74 +245,169 @@ Remember: Use selectors from the provided list, don't invent new ones!
         # Append formatted DOM context from indexer
         if dom_context:
             instructions += f"\n\n---\n\n{dom_context}"
-        
+
+        # Identical prompts for the same model replay the cached plan instead of calling the LLM
+        cache_key = None
+        cached = None
+        if self._use_plan_cache:
+            cache_key = _plan_cache_key(model_name, _SCENARIO_BUILDER_INSTRUCTION, instructions)
+            cached = self._load_cached_plan(cache_key)
+        if cached is not None:
+            plan_dict, transcript = cached
+            print("[ui-test-agent] Using cached scenario plan")
+            scenario = _scenario_from_dict(plan_dict, base_env)
+            return GeneratedScenario(
+                scenario=scenario, raw_plan=plan_dict, transcript=transcript, plan_cache_key=cache_key
+            )
+
+        # Agent and runner are built once per model and reused across builds
+        runner = _get_runner(model_name)
+
         message = types.Content(role="user", parts=[types.Part(text=instructions)])
         transcript: List[TranscriptEntry] = []
+        # Set by _consume once an entry holds a complete scenario, see _complete_scenario_json()
+        final_json: Optional[str] = None
 
-        async def _consume():
+        async def _consume(session):
             """
             Consume ADK agent events and build transcript.
             Handles all part types: text, function_call, thought_signature, etc.
+            Stops early once an entry contains a complete scenario JSON.
             """
-            async for event in runner.run_async(
+            nonlocal final_json
+            events = runner.run_async(
                 user_id="local-user",
                 session_id=session.id,
                 new_message=message,
-            ):
-                if event.content and event.content.parts:
-                    text_parts: List[str] = []
-                    for part in event.content.parts:
-                        # Handle text parts
-                        if getattr(part, "text", None):
-                            text_parts.append(part.text)
-                        
-                        # Handle function calls (agent tool invocations)
-                        elif getattr(part, "function_call", None):
-                            fn = part.function_call
-                            fn_name = getattr(fn, "name", "unknown_function")
-                            args = getattr(fn, "args", None)
+            )
+            async with contextlib.aclosing(events):
+                async for event in events:
+                    if event.content and event.content.parts:
+                        text_parts: List[str] = []
+                        for part in event.content.parts:
+                            # Handle text parts
+                            if getattr(part, "text", None):
+                                text_parts.append(part.text)
                             
-                            # Log function call for debugging
-                            if args:
-                                if isinstance(args, str):
-                                    text_parts.append(f"[Function: {fn_name}]\n{args}")
-                                else:
-                                    try:
-                                        args_json = json.dumps(args, ensure_ascii=False, indent=2)
-                                        text_parts.append(f"[Function: {fn_name}]\n{args_json}")
-                                    except Exception:
-                                        text_parts.append(f"[Function: {fn_name}]\n{str(args)}")
-                        
-                        # Handle thought signatures (internal reasoning - skip for transcript)
-                        elif getattr(part, "thought_signature", None):
-                            # These are internal model thoughts, not needed in transcript
-                            pass
+                            # Handle function calls (agent tool invocations)
+                            elif getattr(part, "function_call", None):
+                                fn = part.function_call
+                                fn_name = getattr(fn, "name", "unknown_function")
+                                args = getattr(fn, "args", None)
+                                
+                                # Log function call for debugging
+                                if args:
+                                    if isinstance(args, str):
+                                        text_parts.append(f"[Function: {fn_name}]\n{args}")
+                                    else:
+                                        try:
+                                            args_json = _json_dumps(args, indent=True)
+                                            text_parts.append(f"[Function: {fn_name}]\n{args_json}")
+                                        except Exception:
+                                            text_parts.append(f"[Function: {fn_name}]\n{str(args)}")
+                            
+                            # Handle thought signatures (internal reasoning - skip for transcript)
+                            elif getattr(part, "thought_signature", None):
+                                # These are internal model thoughts, not needed in transcript
+                                pass
+                            
+                            # Handle any other part types
+                            else:
+                                part_type = type(part).__name__
+                                # Only log if it's something unexpected
+                                if part_type not in ["ThoughtSignature", "Thought"]:
+                                    text_parts.append(f"[{part_type}]: {str(part)[:200]}")
                         
-                        # Handle any other part types
-                        else:
-                            part_type = type(part).__name__
-                            # Only log if it's something unexpected
-                            if part_type not in ["ThoughtSignature", "Thought"]:
-                                text_parts.append(f"[{part_type}]: {str(part)[:200]}")
-                    
-                    if text_parts:
-                        transcript.append(
-                            TranscriptEntry(
-                                author=event.author or "agent",
-                                text="\n".join(text_parts),
+                        if text_parts:
+                            transcript.append(
+                                TranscriptEntry(
+                                    author=event.author or "agent",
+                                    text="\n".join(text_parts),
+                                )
                             )
-                        )
+                            # Trailing events are not needed once the scenario is complete
+                            entry = transcript[-1]
+                            if '"flow"' in entry.text:
+                                final_json = _complete_scenario_json(entry.text)
+                                if final_json is not None:
+                                    break
+
+        async def _session_lifecycle():
+            """
+            Create session and consume events in one coroutine, so the whole
+            exchange costs a single hop to the background loop.
+            The cached runner stays open; it is closed at interpreter exit.
+            """
+            # Use async session creation (create_session_sync is deprecated)
+            session = await runner.session_service.create_session(
+                app_name=runner.app_name,
+                user_id="local-user",
+            )
+            try:
+                await _consume(session)
+            finally:
+                # Drop the session so the shared runner doesn't accumulate history
+                await runner.session_service.delete_session(
+                    app_name=runner.app_name,
+                    user_id="local-user",
+                    session_id=session.id,
+                )
 
-        _run_sync(_consume())
-        _run_sync(runner.close())
+        _run_sync(_session_lifecycle())
 
         if not transcript:
             raise ScenarioError("ADK NL orchestrator produced no output")
         
-        raw_response = _extract_final_json(transcript)
+        raw_response = final_json or _extract_final_json(transcript)
         plan_dict = _safe_json_loads(raw_response)
         scenario = _scenario_from_dict(plan_dict, base_env)
-        return GeneratedScenario(scenario=scenario, raw_plan=plan_dict, transcript=transcript)
+        if cache_key is not None:
+            self._store_cached_plan(cache_key, plan_dict, transcript)
+        return GeneratedScenario(
+            scenario=scenario, raw_plan=plan_dict, transcript=transcript, plan_cache_key=cache_key
+        )
+
+    # --- Plan cache -------------------------------------------------------------
+
+    def _plan_cache_path(self, key: str) -> Path:
+        return Path(self.settings.artifacts_dir) / "plan_cache" / f"{key}.json"
+
+    def _load_cached_plan(self, key: str) -> Optional[Tuple[Dict[str, Any], List[TranscriptEntry]]]:
+        """
+        Load a previously generated plan if present and not expired.
+        Returns None on cache miss, expiry, or unreadable cache file.
+        """
+        path = self._plan_cache_path(key)
+        try:
+            if time.time() - path.stat().st_mtime >= self._plan_cache_ttl:
+                return None
+            data = _json_loads(path.read_bytes())
+            transcript = [TranscriptEntry(author=e["author"], text=e["text"]) for e in data["transcript"]]
+            return data["plan"], transcript
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _store_cached_plan(self, key: str, plan: Dict[str, Any], transcript: List[TranscriptEntry]) -> None:
+        """Persist a generated plan for later replay (best effort)."""
+        path = self._plan_cache_path(key)
+        data = {
+            "plan": plan,
+            "transcript": [{"author": e.author, "text": e.text} for e in transcript],
+        }
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(_json_dumps(data), encoding="utf-8")
+        except OSError:
+            pass
+
+    def discard_cached_plan(self, generated: GeneratedScenario) -> None:
+        """Drop the cached plan behind a scenario (e.g. after it failed), so the next build asks the LLM again."""
+        if generated.plan_cache_key is None:
+            return
+        try:
+            self._plan_cache_path(generated.plan_cache_key).unlink()
+        except OSError:
+            pass
 
     # --- Heuristic fallback ---------------------------------------------------
 
@@ -324,7 +459,7 @@ Remember: Use selectors from the provided list, don't invent new ones!
 
         plan_dict = {"meta": meta, "env": env, "flow": flow}
         transcript = [
-            TranscriptEntry(author="heuristic_planner", text=json.dumps(plan_dict, ensure_ascii=False, indent=2))
+            TranscriptEntry(author="heuristic_planner", text=_json_dumps(plan_dict, indent=True))
         ]
         scenario = _scenario_from_dict(plan_dict, base_env)
         return GeneratedScenario(scenario=scenario, raw_plan=plan_dict, transcript=transcript)
@@ -336,7 +471,7 @@ def _scenario_from_dict(data: Dict[str, Any], base_env: Dict[str, Any]) -> Scena
     Validates and normalizes flow steps.
     """
     meta = data.get("meta", {})
-    env = deep_merge({"baseUrl": base_env.get("baseUrl")}, data.get("env", {}))
+    env = deep_merge({"baseUrl": base_env.get("baseUrl")}, data.get("env") or {})
     flow = data.get("flow", [])
     
     # Better validation with context
@@ -370,7 +505,7 @@ def _scenario_from_dict(data: Dict[str, Any], base_env: Dict[str, Any]) -> Scena
 def _safe_json_loads(raw: str) -> Dict[str, Any]:
     raw = raw.strip()
     try:
-        return json.loads(raw)
+        return _json_loads(raw)
     except json.JSONDecodeError as exc:
         raise ScenarioError("Failed to parse scenario JSON from NL orchestrator") from exc
 
@@ -381,9 +516,6 @@ def _extract_final_json(transcript: List[TranscriptEntry]) -> str:
     Looks for the most complete scenario JSON with 'flow' key.
     Handles both naked JSON and markdown code blocks (```json ... ```).
     """
-    # Pattern to match JSON within markdown code blocks
-    json_block_pattern = re.compile(r'```(?:json)?\s*\n(\{.*?\})\s*\n```', re.DOTALL | re.IGNORECASE)
-    
     best_candidate = None
     best_score = -1
     
@@ -392,7 +524,7 @@ def _extract_final_json(transcript: List[TranscriptEntry]) -> str:
         candidates = []
         
         # 1) Try to find JSON in markdown code block first
-        match = json_block_pattern.search(text)
+        match = _JSON_BLOCK_PATTERN.search(text)
         if match:
             json_candidate = match.group(1).strip()
             if json_candidate.startswith("{") and json_candidate.endswith("}"):
@@ -418,10 +550,14 @@ def _extract_final_json(transcript: List[TranscriptEntry]) -> str:
             if snippet.startswith("{") and snippet.endswith("}"):
                 candidates.append(snippet)
         
-        # Score each candidate
+        # Score each candidate (the fenced and naked forms often coincide)
+        seen = set()
         for cand in candidates:
+            if cand in seen:
+                continue
+            seen.add(cand)
             try:
-                parsed = json.loads(cand)
+                parsed = _json_loads(cand)
                 score = 0
                 
                 # Prioritize JSONs with 'flow' key (the actual scenario)
@@ -440,6 +576,9 @@ def _extract_final_json(transcript: List[TranscriptEntry]) -> str:
                 if set(parsed.keys()) == {"selectors", "messages"}:
                     score = 1  # Low score
                 
+                # flow + meta + env is the best possible score, nothing later can beat it
+                if score >= 120:
+                    return cand
                 if score > best_score:
                     best_score = score
                     best_candidate = cand
@@ -452,6 +591,25 @@ def _extract_final_json(transcript: List[TranscriptEntry]) -> str:
     raise ScenarioError("No valid scenario JSON with 'flow' key found in NL orchestrator transcript")
 
 
+def _complete_scenario_json(text: str) -> Optional[str]:
+    """
+    Return the JSON object spanning the first "{" to the last "}" of text
+    if it parses to a scenario with a non-empty flow, else None.
+    """
+    start = text.find("{")
+    end = text.rfind("}") + 1
+    if start < 0 or end <= start:
+        return None
+    candidate = text[start:end]
+    try:
+        parsed = _json_loads(candidate)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(parsed, dict) and isinstance(parsed.get("flow"), list) and parsed["flow"]:
+        return candidate
+    return None
+
+
 def _normalize_step_format(step: Any) -> Dict[str, Any]:
     if not isinstance(step, dict):
         raise ScenarioError(f"Scenario step must be an object, got: {step}")
@@ -481,64 +639,91 @@ def _normalize_step_format(step: Any) -> Dict[str, Any]:
             if literal:
                 params.setdefault("text", literal)
 
-    match action:
-        case "go":
-            target = params.get("url") or params.get("path")
-            return {"go": target or "/"}
-        case "type":
-            return {
-                "type": {
-                    "into": params.get("selector") or params.get("into", ""),
-                    "text": params.get("text") or params.get("value", ""),
-                }
-            }
-        case "click":
-            return {"click": {"on": params.get("selector") or params.get("on", "")}}
-        case "see":
-            payload = {}
-            text = params.get("text") or params.get("value")
-            selector_hint = params.get("selector")
-            if not text and selector_hint:
-                extracted = _extract_text_literal(selector_hint)
-                if extracted:
-                    text = extracted
-            if text:
-                payload["text"] = text
-            meaning = (
-                params.get("meaning")
-                or params.get("expected")
-                or params.get("assertion")
-                or params.get("description")
-            )
-            if meaning:
-                payload["meaning"] = meaning
-            if not payload:
-                payload["meaning"] = "verify desired outcome"
-            return {"see": payload}
-        case "seeUrl":
-            return {"seeUrl": params.get("fragment") or params.get("value") or params.get("url", "")}
-        case "waitApi":
-            payload = {
-                "url": params.get("url") or params.get("pattern"),
-                "code": params.get("code") or 200,
-            }
-            if schema := params.get("schema"):
-                payload["schema"] = schema
-            return {"waitApi": payload}
-        case "a11y":
-            return {"a11y": {"exclude": params.get("exclude", [])}}
-        case _:
-            return {action: params}
+    handler = _ACTION_HANDLERS.get(action)
+    return handler(params) if handler else {action: params}
+
+
+def _norm_go(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"go": params.get("url") or params.get("path") or "/"}
+
+
+def _norm_type(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": {
+            "into": params.get("selector") or params.get("into", ""),
+            "text": params.get("text") or params.get("value", ""),
+        }
+    }
+
+
+def _norm_click(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"click": {"on": params.get("selector") or params.get("on", "")}}
+
+
+def _norm_see(params: Dict[str, Any]) -> Dict[str, Any]:
+    payload = {}
+    text = params.get("text") or params.get("value")
+    selector_hint = params.get("selector")
+    if not text and selector_hint:
+        extracted = _extract_text_literal(selector_hint)
+        if extracted:
+            text = extracted
+    if text:
+        payload["text"] = text
+    meaning = (
+        params.get("meaning")
+        or params.get("expected")
+        or params.get("assertion")
+        or params.get("description")
+    )
+    if meaning:
+        payload["meaning"] = meaning
+    if not payload:
+        payload["meaning"] = "verify desired outcome"
+    return {"see": payload}
+
+
+def _norm_see_url(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"seeUrl": params.get("fragment") or params.get("value") or params.get("url", "")}
+
+
+def _norm_wait_api(params: Dict[str, Any]) -> Dict[str, Any]:
+    payload = {
+        "url": params.get("url") or params.get("pattern"),
+        "code": params.get("code") or 200,
+    }
+    if schema := params.get("schema"):
+        payload["schema"] = schema
+    return {"waitApi": payload}
+
+
+def _norm_a11y(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {"a11y": {"exclude": params.get("exclude", [])}}
+
+
+# Step normalizers by action name; unknown actions pass their params through
+_ACTION_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "go": _norm_go,
+    "type": _norm_type,
+    "click": _norm_click,
+    "see": _norm_see,
+    "seeUrl": _norm_see_url,
+    "waitApi": _norm_wait_api,
+    "a11y": _norm_a11y,
+}
 
 
 def _extract_text_literal(selector: str) -> Optional[str]:
     selector = selector.strip()
-    patterns = ["text=", "text:", "text->", "text"]
-    for prefix in patterns:
-        if selector.lower().startswith(prefix):
-            literal = selector[len(prefix):].strip()
-            return literal.strip("\"' ")
-    if selector.startswith("text(\"") or selector.startswith("text('"):
+    # "text=", "text:", "text->" or bare "text" prefix, case-insensitive
+    if selector[:4].lower() == "text":
+        literal = selector[4:]
+        if literal.startswith(("=", ":")):
+            literal = literal[1:]
+        elif literal.startswith("->"):
+            literal = literal[2:]
+        return literal.strip().strip("\"' ")
+    if selector.startswith(_TEXT_CALL_PREFIXES):
         literal = selector[5:-1]
         return literal.strip("\"' ")
     if selector.startswith(":has-text("):
@@ -549,10 +734,10 @@ def _extract_text_literal(selector: str) -> Optional[str]:
 
 def _normalize_selector(selector: str) -> str:
     selector = selector.strip()
-    if selector.lower().startswith("text="):
-        literal = selector.split("=", 1)[1].strip().strip("\"'")
+    if selector[:5].lower() == "text=":
+        literal = selector[5:].strip().strip("\"'")
         return _build_text_fallback(literal)
-    if selector.startswith("text(\"") or selector.startswith("text('"):
+    if selector.startswith(_TEXT_CALL_PREFIXES):
         literal = selector[5:-1]
         return _build_text_fallback(literal)
     return selector
@@ -598,20 +783,103 @@ def _build_text_fallback(text: str, dom_hints: Optional[Dict[str, str]] = None)
     return "|".join(unique_candidates)
 
 
-def _run_sync(coro):
+def _json_dumps(obj: Any, indent: bool = False) -> str:
+    """Serialize to a UTF-8 JSON string, using orjson when installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+
+def _json_loads(raw: Any) -> Any:
     """
-    Safely run async coroutine in sync context.
-    Ensures event loop is properly cleaned up even on exceptions.
+    Parse JSON from str or bytes, using orjson when installed.
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the latter.
     """
-    import asyncio
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    except Exception:
-        raise
-    finally:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _plan_cache_key(model_name: str, instruction: str, payload: str) -> str:
+    """Stable cache key for a (model, system instruction, user payload) triple."""
+    digest = hashlib.sha256()
+    for part in (model_name, instruction, payload):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=4)
+def _get_agent(model_name: str):
+    """Build the scenario builder agent once per model name."""
+    # HYBRID APPROACH: Single agent with rich context from ContextBuilder
+    # No multi-agent orchestration - simpler, faster, more reliable
+    return Agent(
+        name="scenario_builder",
+        description="Builds complete test scenarios from natural language with rich context",
+        instruction=_SCENARIO_BUILDER_INSTRUCTION,
+        model=model_name,
+    )
+
+
+def _get_runner(model_name: str):
+    """Return the cached InMemoryRunner for a model, creating it on first use."""
+    with _RUNNERS_LOCK:
+        runner = _RUNNERS.get(model_name)
+        if runner is None:
+            runner = InMemoryRunner(agent=_get_agent(model_name), app_name="agents")
+            _RUNNERS[model_name] = runner
+        return runner
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the shared background event loop, starting its thread on first use.
+    ADK calls are dispatched here instead of spinning up a loop per coroutine.
+    """
+    global _LOOP_THREAD
+    with _LOOP_LOCK:
+        if _LOOP_THREAD is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever,
+                name="ui-test-agent-adk-loop",
+                daemon=True,
+            )
+            thread.start()
+            _LOOP_THREAD = (loop, thread)
+            atexit.register(_stop_loop)
+        return _LOOP_THREAD[0]
+
+
+def _stop_loop() -> None:
+    """Stop the shared background loop at interpreter exit."""
+    global _LOOP_THREAD
+    if _LOOP_THREAD is None:
+        return
+    loop, thread = _LOOP_THREAD
+    _LOOP_THREAD = None
+    with _RUNNERS_LOCK:
+        runners = list(_RUNNERS.values())
+        _RUNNERS.clear()
+    for runner in runners:
         try:
-            loop.close()
+            asyncio.run_coroutine_threadsafe(runner.close(), loop).result(timeout=5)
         except Exception:
             pass  # Ignore cleanup errors
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    try:
+        loop.close()
+    except Exception:
+        pass  # Ignore cleanup errors
+
+
+def _run_sync(coro):
+    """
+    Run async coroutine from sync context on the shared background loop.
+    Blocks until the coroutine finishes and re-raises its exception, if any.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _get_loop())
+    return future.result()
@@ -3,7 +3,8 @@ from __future__ import annotations
 import re
 import time
 from dataclasses import dataclass
-from datetime import datetime
+from functools import lru_cache
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urljoin, urlparse
@@ -19,53 +20,64 @@ from .reporting import RunReport, StepResult, render_html, save_report
 
 # ===== Locator Resolution Utilities (previously in locators.py) =====
 
-ROLE_PATTERN = re.compile(r"role=([a-zA-Z0-9_-]+)(\[(.+)\])?")
-ATTR_PATTERN = re.compile(r"([a-zA-Z0-9_-]+)=['\"]?([^'\"]+)['\"]?")
+ROLE_PATTERN = re.compile(r"role=([a-zA-Z0-9_-]+)(\[(.+)\])?", re.ASCII)
+# name="value" | name='value' | name=value; "]" only ends an unquoted value
+ATTR_PATTERN = re.compile(r"""([a-zA-Z0-9_-]+)=(?:"([^"]*)"|'([^']*)'|([^\]'"]+))""", re.ASCII)
 
+# Selector priority needles; the first alternative found anywhere in the
+# selector wins and its group number (1-based) maps to the score
+_SCORE_PATTERN = re.compile(
+    r"(?:(?=.*?(data-testid))|(?=.*?(role=))|(?=.*?(#))"
+    r"|(?=.*?(\[name))|(?=.*?(\[placeholder))|(?=.*?(text=)))",
+    re.DOTALL,
+)
 
-def locator_candidates(raw: str) -> List[str]:
+
+@lru_cache(maxsize=4096)
+def locator_candidates(raw: str) -> Tuple[str, ...]:
     """
     Split selector string by pipe (|) and return candidates sorted by priority.
     Priority order: data-testid > role= > # > [name > [placeholder > text= > generic
     """
     parts = [part.strip() for part in raw.split("|") if part.strip()]
-    return sorted(parts, key=_score_selector)
+    return tuple(sorted(parts, key=_score_selector))
 
 
-def _score_selector(selector: str) -> Tuple[int, int]:
-    """Assign priority score to selector. Lower score = higher priority."""
-    checks = [
-        ("data-testid", 0),
-        ("role=", 1),
-        ("#", 2),
-        ("[name", 3),
-        ("[placeholder", 4),
-        ("text=", 5),
-    ]
+@lru_cache(maxsize=4096)
+def _score_selector(selector: str) -> int:
+    """
+    Assign priority score to selector. Lower score = higher priority.
+    Packs (score class, length) into one int: class in the high bits, length below.
+    """
     clean = selector.strip()
-    for needle, score in checks:
-        if needle == "#" and clean.startswith("#"):
-            return (score, len(clean))
-        if needle == "role=" and clean.startswith("role="):
-            return (score, len(clean))
-        if needle in clean:
-            return (score, len(clean))
-    if "nth-child" in clean:
-        return (9, len(clean))
-    return (6, len(clean))
+    match = _SCORE_PATTERN.match(clean)
+    if match:
+        score = match.lastindex - 1
+    elif "nth-child" in clean:
+        score = 9
+    else:
+        score = 6
+    return (score << 32) | len(clean)
 
 
 def parse_role(raw: str) -> Tuple[str, Dict[str, str]]:
     """Parse Playwright role selector: role=button[name="Submit"]"""
-    match = ROLE_PATTERN.fullmatch(raw.strip())
+    role, attrs = _parse_role_cached(raw.strip())
+    return role, dict(attrs)
+
+
+@lru_cache(maxsize=1024)
+def _parse_role_cached(raw: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    match = ROLE_PATTERN.fullmatch(raw)
     if not match:
         raise ValueError(f"Invalid role selector: {raw}")
     role = match.group(1)
     attrs_str = match.group(3) or ""
-    attrs: Dict[str, str] = {}
-    for attr_match in ATTR_PATTERN.finditer(attrs_str):
-        attrs[attr_match.group(1)] = attr_match.group(2)
-    return role, attrs
+    attrs: Dict[str, str] = {
+        name: double or single or bare
+        for name, double, single, bare in ATTR_PATTERN.findall(attrs_str)
+    }
+    return role, tuple(attrs.items())
 
 
 @dataclass
@@ -84,7 +96,7 @@ class ScenarioRunner:
         self.step_retries = max(1, self.settings.retry.step)
 
     def run(self, scenario_path: str) -> RunnerResult:
-        started = datetime.utcnow()
+        started = datetime.now(timezone.utc)
         results: List[StepResult] = []
         status = "passed"
         for index, step in enumerate(self.scenario.flow, start=1):
@@ -93,10 +105,10 @@ class ScenarioRunner:
             screenshot_path = None
             success = False
             for attempt in range(1, self.step_retries + 1):
-                started_at = time.perf_counter()
+                started_at = time.perf_counter_ns()
                 try:
                     self._execute(action, payload)
-                    duration = int((time.perf_counter() - started_at) * 1000)
+                    duration = (time.perf_counter_ns() - started_at) // 1_000_000
                     results.append(
                         StepResult(
                             index=index,
@@ -111,7 +123,7 @@ class ScenarioRunner:
                 except Exception as exc:  # pragma: no cover - runtime errors
                     attempt_error = str(exc)
                     if attempt >= self.step_retries:
-                        duration = int((time.perf_counter() - started_at) * 1000)
+                        duration = (time.perf_counter_ns() - started_at) // 1_000_000
                         screenshot_path = self._capture_failure(index)
                         context_text = self._collect_context(action)
                         results.append(
@@ -131,7 +143,7 @@ class ScenarioRunner:
                         continue
             if not success:
                 break
-        finished = datetime.utcnow()
+        finished = datetime.now(timezone.utc)
         report = RunReport(
             scenario_path=scenario_path,
             meta=self.scenario.meta,